@@ -2,27 +2,64 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
 from typing import List
 from datetime import datetime
 
 from ..models.cleaner import Cleaner
 from ..models.job import Job
-from ..models.schedule import ScheduleOptimizationResult
+from ..models.schedule import ScheduleJobInfo, ScheduleJobStatus, ScheduleOptimizationResult, ScheduleRepairRequest
 from src.services.temp.assignment_service import OptimizedAssignmentService
 from ..data.dummy import DummyDataGenerator
 from ..services.distance_service import DistanceService
-from ..services.road_distance_service import RoadDistanceService
+from ..services.async_road_distance_service import AsyncRoadDistanceService
+from ..services.travel_time_cache import PersistentTravelTimeCache
+from ..services.circuit_breaker import CircuitBreaker
+from ..services.offline_road_distance_service import OfflineRoadDistanceService
+from ..services.hybrid_distance_service import HybridDistanceService
+from ..services.schedule_result_cache import ScheduleResultCache
+from ..services.schedule_job_queue import QueueFullError, ScheduleJobQueue
+from ..config.config import settings
 import os
 
 
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")  # Set this in your .env file
-if GOOGLE_MAPS_API_KEY:
-    distance_service = RoadDistanceService(GOOGLE_MAPS_API_KEY)
+if settings.offline_graph_path:
+    distance_service = OfflineRoadDistanceService(settings.offline_graph_path,
+                                                  settings.offline_hierarchy_path or None)
+elif GOOGLE_MAPS_API_KEY:
+    travel_time_cache = PersistentTravelTimeCache(
+        settings.road_cache_path, settings.road_cache_ttl_hours,
+        max_entries=settings.road_cache_max_entries,
+        max_memory_mb=settings.road_cache_max_memory_mb,
+        symmetric=settings.road_cache_symmetric
+    )
+    distance_service = AsyncRoadDistanceService(
+        GOOGLE_MAPS_API_KEY, cache=travel_time_cache,
+        breaker=CircuitBreaker(settings.road_failure_threshold, settings.road_cooldown_seconds),
+        timeout_seconds=settings.road_request_timeout_seconds,
+        failure_ttl_seconds=settings.road_failure_ttl_seconds,
+        max_in_flight=settings.road_max_in_flight_requests,
+        bucket_minutes=settings.travel_time_bucket_minutes
+    )
+    if settings.use_hybrid_distances:
+        # Road times only for the candidates the greedy search actually compares
+        distance_service = HybridDistanceService(distance_service, settings.hybrid_refine_batch_size)
 else:
     distance_service = DistanceService()  # Fallback to geodesic
 
 assignment_service = OptimizedAssignmentService(distance_service)
+schedule_cache = ScheduleResultCache(settings.schedule_cache_max_entries, settings.schedule_cache_ttl_seconds,
+                                     settings.schedule_cache_serve_stale)
+# Interactive solves (today's schedule, repairs) run here, off the event loop
+solver_executor = ThreadPoolExecutor(max_workers=settings.schedule_solver_threads, thread_name_prefix="schedule-solver")
+schedule_jobs = ScheduleJobQueue(assignment_service, settings.schedule_job_workers,
+                                 settings.schedule_job_max_pending, settings.schedule_job_max_finished)
 app = FastAPI()
 
 
@@ -39,6 +76,20 @@ cleaners_db = DummyDataGenerator.create_cleaners()
 jobs_db = DummyDataGenerator.create_jobs()
 #assignment_service = SimpleAssignmentService()
 
+@app.on_event("startup")
+async def start_solver_workers():
+    # Multi-start workers take seconds to spawn; do it before the first request's budget starts
+    await asyncio.get_running_loop().run_in_executor(None, assignment_service.start)
+
+@app.on_event("shutdown")
+async def close_distance_service():
+    schedule_jobs.close()
+    solver_executor.shutdown(wait=False, cancel_futures=True)
+    assignment_service.close()
+    provider = getattr(distance_service, "road_service", distance_service)
+    if isinstance(provider, AsyncRoadDistanceService):
+        await provider.aclose()
+
 @app.get("/api/cleaners", response_model=List[Cleaner])
 async def get_cleaners():
     """Hämta alla städare"""
@@ -69,13 +120,89 @@ async def get_job(job_id: str):
 async def get_today_schedule():
     """Hämta dagens schema"""
     target_date = datetime.now()
-    result = assignment_service.create_schedule(cleaners_db, jobs_db, target_date)
-    return result
+    cleaners, jobs = cleaners_db, jobs_db
+    key = schedule_cache.make_key(cleaners, jobs, target_date, settings, settings.today_search_seconds)
+    return await schedule_cache.get_or_compute_async(
+        key, target_date,
+        lambda: assignment_service.create_schedule_async(cleaners, jobs, target_date, settings.today_search_seconds,
+                                                         executor=solver_executor))
 
 @app.post("/api/schedules/generate", response_model=ScheduleOptimizationResult)
-async def generate_schedule(date: datetime = None):
+async def generate_schedule(date: datetime = None, search_seconds: float = None):
     """Generera nytt schema för specifikt datum"""
+    # The caller waits for the answer, so the search gets the interactive budget unless it asks for more
+    if search_seconds is None:
+        search_seconds = settings.today_search_seconds
+    job = _submit_schedule(date, min(max(search_seconds, 0), settings.nightly_search_seconds))
+    job = await schedule_jobs.wait(job.id)
+    if job.status == ScheduleJobStatus.FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status == ScheduleJobStatus.CANCELLED:
+        raise HTTPException(status_code=409, detail="Schedule generation was cancelled")
+    return job.result
+
+@app.get("/api/schedules/stream")
+async def stream_schedule(date: datetime = None):
+    """Strömma schemat som server-sent events medan det byggs och förbättras"""
+    if not date:
+        date = datetime.now()
+
+    async def events():
+        # aclosing stops the solver when the client disconnects
+        async with aclosing(assignment_service.stream_schedule_async(
+                cleaners_db, jobs_db, date, settings.nightly_search_seconds, executor=solver_executor)) as updates:
+            try:
+                async for progress in updates:
+                    yield f"event: {progress.stage}\ndata: {progress.model_dump_json()}\n\n"
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/api/schedules/jobs", response_model=ScheduleJobInfo, status_code=202)
+async def submit_schedule_job(date: datetime = None):
+    """Starta schemagenerering i bakgrunden och returnera jobbets id"""
+    return _submit_schedule(date, settings.nightly_search_seconds)
+
+def _submit_schedule(date: datetime, search_seconds: float) -> ScheduleJobInfo:
     if not date:
         date = datetime.now()
-    result = assignment_service.create_schedule(cleaners_db, jobs_db, date)
-    return result
\ No newline at end of file
+    # Identical requests while a generation is pending join it instead of solving again
+    key = schedule_cache.make_key(cleaners_db, jobs_db, date, settings, search_seconds)
+    try:
+        return schedule_jobs.submit(cleaners_db, jobs_db, date, search_seconds, key)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@app.get("/api/schedules/jobs/{job_id}", response_model=ScheduleJobInfo)
+async def get_schedule_job(job_id: str, wait: float = 0):
+    """Hämta status och resultat för ett schemajobb; vänta upp till wait sekunder på att det blir klart"""
+    job = await schedule_jobs.wait(job_id, min(max(wait, 0), ScheduleJobQueue.MAX_WAIT_SECONDS))
+    if not job:
+        raise HTTPException(status_code=404, detail="Schedule job not found")
+    return job
+
+@app.delete("/api/schedules/jobs/{job_id}", response_model=ScheduleJobInfo)
+async def cancel_schedule_job(job_id: str):
+    """Avbryt ett köat eller pågående schemajobb"""
+    job = schedule_jobs.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Schedule job not found")
+    return job
+
+@app.post("/api/schedules/repair", response_model=ScheduleOptimizationResult)
+async def repair_schedule(request: ScheduleRepairRequest):
+    """Uppdatera ett befintligt schema när jobb eller städare läggs till, ändras eller tas bort"""
+    global cleaners_db, jobs_db
+    result = request.result
+    date = result.schedules[0].date if result.schedules else datetime.now()
+    repaired = await assignment_service.repair_schedule_async(result, request.delta, cleaners_db, jobs_db, date,
+                                                              executor=solver_executor)
+    cleaners_db, jobs_db = request.delta.apply(cleaners_db, jobs_db)
+    schedule_cache.invalidate()
+    return repaired
+
+@app.delete("/api/schedules/cache")
+async def invalidate_schedule_cache(date: datetime = None):
+    """Töm schemacachen (alla dagar eller en specifik dag)"""
+    return {"invalidated": schedule_cache.invalidate(date.date() if date else None)}
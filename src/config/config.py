@@ -8,7 +8,39 @@ class Settings(BaseSettings):
     lunch_window_end: str = "13:30"
     use_road_distances: bool = True
     clustering_grid_size: int = 5
+    clustering_method: str = "balanced_kmeans"
+    cluster_capacity_slack: float = 0.2
     min_jobs_for_2opt: int = 4
+    construction_method: str = "regret"
+    regret_k: int = 2
+    today_search_seconds: float = 0.2
+    nightly_search_seconds: float = 30.0
+    parallel_workers: int = 1
+    schedule_cache_max_entries: int = 32
+    schedule_cache_ttl_seconds: float = 300.0
+    schedule_cache_serve_stale: bool = True
+    schedule_job_workers: int = 1
+    schedule_solver_threads: int = 2
+    schedule_job_max_pending: int = 16
+    schedule_job_max_finished: int = 100
+    use_travel_time_matrix: bool = True
+    use_time_profiles: bool = False
+    travel_time_bucket_minutes: int = 30
+    use_spatial_index: bool = True
+    road_cache_path: str = "travel_time_cache.sqlite3"
+    road_cache_ttl_hours: float = 24 * 30
+    road_cache_max_entries: int = 200_000
+    road_cache_max_memory_mb: float = 64
+    road_cache_symmetric: bool = False
+    road_max_in_flight_requests: int = 8
+    road_request_timeout_seconds: float = 10.0
+    road_failure_threshold: int = 5
+    road_cooldown_seconds: float = 60.0
+    road_failure_ttl_seconds: float = 300.0
+    offline_graph_path: str = ""
+    use_hybrid_distances: bool = False
+    hybrid_refine_batch_size: int = 3
+    offline_hierarchy_path: str = ""
 
     # Convert lunch duration to hours for compatibility
     @property
@@ -20,6 +52,14 @@ class Settings(BaseSettings):
     def CLUSTERING_GRID_SIZE(self) -> int:
         return self.clustering_grid_size
 
+    @property
+    def CLUSTERING_METHOD(self) -> str:
+        return self.clustering_method
+
+    @property
+    def CLUSTER_CAPACITY_SLACK(self) -> float:
+        return self.cluster_capacity_slack
+
     @property
     def LUNCH_DURATION_HOURS(self) -> float:
         return self.lunch_duration_hours
@@ -38,6 +78,34 @@ class Settings(BaseSettings):
     def MIN_JOBS_FOR_2OPT(self) -> int:
         return self.min_jobs_for_2opt
 
+    @property
+    def CONSTRUCTION_METHOD(self) -> str:
+        return self.construction_method
+
+    @property
+    def REGRET_K(self) -> int:
+        return self.regret_k
+
+    @property
+    def PARALLEL_WORKERS(self) -> int:
+        return self.parallel_workers
+
+    @property
+    def USE_TRAVEL_TIME_MATRIX(self) -> bool:
+        return self.use_travel_time_matrix
+
+    @property
+    def USE_TIME_PROFILES(self) -> bool:
+        return self.use_time_profiles
+
+    @property
+    def TRAVEL_TIME_BUCKET_MINUTES(self) -> int:
+        return self.travel_time_bucket_minutes
+
+    @property
+    def USE_SPATIAL_INDEX(self) -> bool:
+        return self.use_spatial_index
+
     class Config:
         env_file = ".env"
 
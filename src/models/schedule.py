@@ -1,7 +1,11 @@
 from datetime import datetime, time
-from typing import List, Optional
+from enum import Enum
+from typing import List, Optional, Tuple
 from pydantic import BaseModel
 
+from src.models.cleaner import Cleaner
+from src.models.job import Job
+
 class Assignment(BaseModel):
     job_id: str
     cleaner_id: str
@@ -28,4 +32,60 @@ class ScheduleOptimizationResult(BaseModel):
     unassigned_jobs: List[str]
     total_travel_time: float
     optimization_score: float
-    created_at: datetime
\ No newline at end of file
+    created_at: datetime
+
+class ScheduleDelta(BaseModel):
+    """Edits to the jobs and cleaners behind an existing schedule"""
+    added_jobs: List[Job] = []
+    changed_jobs: List[Job] = []
+    removed_job_ids: List[str] = []
+    added_cleaners: List[Cleaner] = []
+    changed_cleaners: List[Cleaner] = []
+    removed_cleaner_ids: List[str] = []
+
+    def apply(self, cleaners: List[Cleaner], jobs: List[Job]) -> Tuple[List[Cleaner], List[Job]]:
+        """The cleaner and job lists with this delta applied (changed entries replaced in place)"""
+        return (self._apply(cleaners, self.added_cleaners, self.changed_cleaners, self.removed_cleaner_ids),
+                self._apply(jobs, self.added_jobs, self.changed_jobs, self.removed_job_ids))
+
+    @staticmethod
+    def _apply(items: list, added: list, changed: list, removed_ids: List[str]) -> list:
+        changed_by_id = {item.id: item for item in changed}
+        removed = set(removed_ids)
+        kept = [changed_by_id.get(item.id, item) for item in items if item.id not in removed]
+        known = {item.id for item in kept}
+        return kept + [item for item in added if item.id not in known]
+
+class ScheduleRepairRequest(BaseModel):
+    result: ScheduleOptimizationResult
+    delta: ScheduleDelta
+
+class ScheduleProgress(BaseModel):
+    stage: str  # "route", "constructed", "improved" or "done"
+    schedules: List[DailySchedule]  # Only the schedules that changed since the previous update
+    unassigned_jobs: List[str]
+    optimization_score: float
+    elapsed_seconds: float
+    result: Optional[ScheduleOptimizationResult] = None  # Set on the final "done" update
+
+class ScheduleJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    CANCELLING = "cancelling"  # Asked to stop; still holds its slot until the solver returns
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class ScheduleJobInfo(BaseModel):
+    id: str
+    status: ScheduleJobStatus
+    target_date: datetime
+    submitted_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    result: Optional[ScheduleOptimizationResult] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (ScheduleJobStatus.SUCCEEDED, ScheduleJobStatus.FAILED, ScheduleJobStatus.CANCELLED)
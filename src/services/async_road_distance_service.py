@@ -0,0 +1,141 @@
+import asyncio
+import httpx
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from .road_distance_service import RoadDistanceService
+from .travel_time_cache import TravelTimeCache
+from .travel_time_matrix import TravelTimeMatrix
+from .circuit_breaker import CircuitBreaker
+
+
+class AsyncRoadDistanceService(RoadDistanceService):
+    """Road distances fetched with a pooled asyncio HTTP client.
+
+    Shares caching, tiling and response parsing with RoadDistanceService, so after
+    ``await prefetch_async(points)`` the synchronous solver reads everything from the
+    cache. Single-pair lookups awaited concurrently are collected for ``batch_window_ms``
+    and sent as one batched request per origin.
+    """
+
+    DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+    def __init__(self, api_key: str, cache: Optional[TravelTimeCache] = None,
+                 breaker: Optional[CircuitBreaker] = None, timeout_seconds: float = 10.0,
+                 failure_ttl_seconds: float = 300.0, max_in_flight: int = 8,
+                 max_connections: int = 20, batch_window_ms: float = 5.0, bucket_minutes: int = 30):
+        super().__init__(api_key, cache, breaker, timeout_seconds, failure_ttl_seconds, bucket_minutes)
+        self.api_key = api_key
+        self.max_in_flight = max_in_flight
+        self.max_connections = max_connections
+        self.batch_window_ms = batch_window_ms
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending: Dict[Tuple[Tuple[float, float], Tuple[float, float]], asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def prefetch_async(self, points: Sequence[Tuple[float, float]],
+                             departure_times: Optional[Sequence[datetime]] = None) -> None:
+        """Fill the cache for every pair of points, running tile requests concurrently"""
+        points = TravelTimeMatrix.unique_points(points)
+        await asyncio.gather(*(self._fetch_missing_async(points, points, departure)
+                               for departure in departure_times or [None]))
+
+    async def get_matrix_async(self, origins: Sequence[Tuple[float, float]],
+                               destinations: Sequence[Tuple[float, float]],
+                               departure: Optional[datetime] = None):
+        origins = [tuple(o) for o in origins]
+        destinations = [tuple(d) for d in destinations]
+        await self._fetch_missing_async(origins, destinations, departure)
+        return self._assemble_matrix(origins, destinations, departure)
+
+    async def calculate_travel_time_hours_async(self, point1: Tuple[float, float],
+                                                point2: Tuple[float, float]) -> float:
+        """Single-pair lookup; concurrent callers share one batched request"""
+        point1, point2 = tuple(point1), tuple(point2)
+        cached = self._cache.get(point1, point2)
+        if cached is not None:
+            return cached[1]
+
+        future = self._pending.get((point1, point2))
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[(point1, point2)] = future
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self._flush_pending())
+        return await future
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _flush_pending(self) -> None:
+        await asyncio.sleep(self.batch_window_ms / 1000)
+        pending, self._pending = self._pending, {}
+
+        # Group by origin so each request bills only the pairs that were asked for
+        by_origin: Dict[Tuple[float, float], List[Tuple[float, float]]] = {}
+        for origin, destination in pending:
+            by_origin.setdefault(origin, []).append(destination)
+        try:
+            await asyncio.gather(*(self._fetch_missing_async([origin], destinations)
+                                   for origin, destinations in by_origin.items()))
+        finally:
+            for (origin, destination), future in pending.items():
+                if future.done():
+                    continue
+                cached = self._cache.get(origin, destination)
+                future.set_result(cached[1] if cached else self._fallback(origin, destination)[1])
+
+    async def _fetch_missing_async(self, origins: List[Tuple[float, float]],
+                                   destinations: List[Tuple[float, float]],
+                                   departure: Optional[datetime] = None) -> None:
+        tiles = list(self._missing_tiles(origins, destinations, departure))
+        if tiles:
+            await asyncio.gather(*(self._fetch_tile_async(o, d, departure) for o, d in tiles))
+
+    async def _fetch_tile_async(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]],
+                                departure: Optional[datetime] = None) -> None:
+        params = {
+            "origins": "|".join(f"{lat},{lng}" for lat, lng in origins),
+            "destinations": "|".join(f"{lat},{lng}" for lat, lng in destinations),
+            "mode": "driving",
+            "departure_time": "now" if departure is None else int(self._api_departure_time(departure).timestamp()),
+            "key": self.api_key,
+        }
+        async with self._get_semaphore():
+            if not self.breaker.allow_request():
+                self._mark_failed(origins, destinations, departure)
+                return
+            try:
+                response = await self._get_client().get(self.DISTANCE_MATRIX_URL, params=params)
+                response.raise_for_status()
+                result = response.json()
+                if result.get('status') != 'OK':
+                    raise RuntimeError(result.get('error_message') or result.get('status'))
+            except httpx.TimeoutException:
+                print(f"Google Maps API timeout after {self.timeout_seconds}s")
+                self.breaker.record_failure(timeout=True)
+                self._mark_failed(origins, destinations, departure)
+                return
+            except Exception as e:
+                print(f"Google Maps API error: {e}")
+                self.breaker.record_failure()
+                self._mark_failed(origins, destinations, departure)
+                return
+        self.breaker.record_success()
+        self._store_response(origins, destinations, result, departure)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+        return self._client
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
@@ -0,0 +1,76 @@
+import threading
+import time as _time
+from typing import Dict
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency for a cool-down window.
+
+    closed    -> calls go through; ``failure_threshold`` consecutive failures open the circuit
+    open      -> calls are refused until ``cooldown_seconds`` have passed
+    half_open -> one trial call is let through; success closes, failure re-opens
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.opened_count = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN:
+                if _time.monotonic() - self._opened_at < self.cooldown_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, timeout: bool = False) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if timeout:
+                self.timeouts += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened_count += 1
+                    print(f"Circuit opened after {self.consecutive_failures} failures "
+                          f"({self.timeouts} timeouts so far); cooling down {self.cooldown_seconds}s")
+                self.state = self.OPEN
+                self._opened_at = _time.monotonic()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "opened_count": self.opened_count,
+        }
@@ -1,9 +1,18 @@
+import numpy as np
+from datetime import datetime
 from geopy.distance import geodesic
-from typing import Tuple
+from typing import Optional, Sequence, Tuple
+from .travel_time_matrix import TravelTimeMatrix
 
 class DistanceService:
 
     AVERAGE_SPEED_KMH = 25 #Better solution might be needed but works rn
+    # Upper bound on effective speed, turns straight-line distance into a travel-time lower bound
+    MAX_SPEED_KMH = AVERAGE_SPEED_KMH
+
+    # WGS84 ellipsoid, used by the vectorized matrix approximation
+    WGS84_A_KM = 6378.137
+    WGS84_E2 = 0.00669437999014
 
     @staticmethod
     def calculate_distance_km(point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
@@ -16,4 +25,38 @@ class DistanceService:
 
     @staticmethod
     def calculate_travel_time_minutes(point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
-        return DistanceService.calculate_travel_time_hours(point1, point2) * 60
\ No newline at end of file
+        return DistanceService.calculate_travel_time_hours(point1, point2) * 60
+
+    @staticmethod
+    def distance_matrix_km(points: Sequence[Tuple[float, float]]) -> np.ndarray:
+        """Vectorized all-pairs distances (haversine on the local ellipsoid radius of curvature)"""
+        coords = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+        lat = coords[:, 0][:, None]
+        lng = coords[:, 1][:, None]
+
+        dlat = lat.T - lat
+        dlng = lng.T - lng
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlng / 2) ** 2
+        central_angle = 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+        # Gaussian mean radius sqrt(M * N) at the mid latitude of each pair
+        sin2 = np.sin((lat + lat.T) / 2) ** 2
+        w = 1 - DistanceService.WGS84_E2 * sin2
+        radius = DistanceService.WGS84_A_KM * np.sqrt(1 - DistanceService.WGS84_E2) / w
+        return central_angle * radius
+
+    def prefetch(self, points: Sequence[Tuple[float, float]],
+                 departure_times: Optional[Sequence[datetime]] = None) -> None:
+        """Warm any remote lookups for the given points (nothing to do for geodesic distances)"""
+        return None
+
+    def build_travel_time_matrix(self, points: Sequence[Tuple[float, float]]) -> TravelTimeMatrix:
+        """Build the travel-time matrix for all points in one vectorized pass"""
+        points = TravelTimeMatrix.unique_points(points)
+        hours = self.distance_matrix_km(points) / self.AVERAGE_SPEED_KMH
+        return TravelTimeMatrix(points, hours)
+
+    def build_travel_time_profile(self, points: Sequence[Tuple[float, float]], target_date: datetime,
+                                  departure_times: Sequence[datetime]) -> TravelTimeMatrix:
+        """Time-dependent matrix; geodesic travel times do not depend on the departure time"""
+        return self.build_travel_time_matrix(points)
@@ -0,0 +1,142 @@
+import numpy as np
+from datetime import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from .distance_service import DistanceService
+from .road_distance_service import RoadDistanceService
+from .travel_time_matrix import TravelTimeMatrix
+
+
+class RefinableTravelTimeMatrix(TravelTimeMatrix):
+    """Travel-time matrix that starts from geodesic estimates and asks for road times on demand.
+
+    Estimates are geodesic travel times scaled by a detour factor learned per region
+    (grid cell of the origin) from the road answers received so far; they only order
+    candidates. ``lower_bounds`` are straight-line distances at the road provider's
+    MAX_SPEED_KMH, which no road time can beat. ``refine`` and ``refine_pairs`` replace
+    estimates with road times, requesting only the pairs asked for; refined entries are
+    never estimated again. ``hours`` is updated in place, so views of it stay current.
+    """
+
+    is_estimated = True
+    LEARNING_RATE = 0.2
+
+    def __init__(self, points: Sequence[Tuple[float, float]], distance_km: np.ndarray,
+                 road_service: RoadDistanceService, refine_batch_size: int = 3,
+                 region_size_deg: float = 0.05):
+        base_hours = distance_km / DistanceService.AVERAGE_SPEED_KMH
+        super().__init__(points, base_hours.copy())
+        self.base_hours = base_hours
+        self.bound_hours = distance_km / road_service.MAX_SPEED_KMH
+        self.road_service = road_service
+        self.refine_batch_size = refine_batch_size
+        self.exact = np.zeros(base_hours.shape, dtype=bool)
+        np.fill_diagonal(self.exact, True)
+
+        coords = np.asarray(self.points, dtype=float).reshape(-1, 2)
+        cells = np.floor(coords / region_size_deg).astype(np.int64)
+        _, self.region_of = np.unique(cells, axis=0, return_inverse=True)
+        self.region_of = self.region_of.reshape(-1)
+        self.region_factor = np.ones(self.region_of.max() + 1 if len(coords) else 0)
+        self.region_learned = np.zeros(len(self.region_factor), dtype=bool)
+        self.global_factor = 1.0
+        self.refined_pairs = 0
+
+    def lower_bounds(self, i: int, js: Sequence[int], departure: Optional[time] = None) -> np.ndarray:
+        return self.bound_hours[i, np.asarray(js, dtype=np.int64)]
+
+    def refine(self, i: int, js: Sequence[int], departure: Optional[time] = None) -> np.ndarray:
+        js = np.asarray(js, dtype=np.int64)
+        return self.refine_pairs(np.full(len(js), i, dtype=np.int64), js, departure)
+
+    def refine_pairs(self, origins: Sequence[int], destinations: Sequence[int],
+                     departure: Optional[time] = None) -> np.ndarray:
+        """Road times for the pairs (origins[k], destinations[k]).
+
+        Only the unrefined pairs are requested: grouped by origin, with origins that need
+        the same destinations sharing one request, so no element outside the given pairs
+        is ever fetched.
+        """
+        origins = np.asarray(origins, dtype=np.int64)
+        destinations = np.asarray(destinations, dtype=np.int64)
+        need = ~self.exact[origins, destinations]
+        wanted: Dict[int, set] = {}
+        for i, j in zip(origins[need].tolist(), destinations[need].tolist()):
+            wanted.setdefault(i, set()).add(j)
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        for i, js in wanted.items():
+            groups.setdefault(tuple(sorted(js)), []).append(i)
+
+        for cols, rows in groups.items():
+            rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+            _, road_hours = self.road_service.get_matrix([self.points[i] for i in rows],
+                                                         [self.points[j] for j in cols])
+            block = np.ix_(rows, cols)
+            self.hours[block] = road_hours
+            self.exact[block] = True
+            self.refined_pairs += road_hours.size
+            self._learn(rows, cols, road_hours)
+        return self.hours[origins, destinations]
+
+    def calculate_travel_time_hours(self, point1: Tuple[float, float], point2: Tuple[float, float],
+                                    departure: Optional[time] = None) -> float:
+        return float(self.refine(self.index_of(point1), [self.index_of(point2)], departure)[0])
+
+    def _learn(self, rows: np.ndarray, cols: np.ndarray, road_hours: np.ndarray) -> None:
+        base = self.base_hours[np.ix_(rows, cols)]
+        valid = base > 0
+        if not valid.any():
+            return
+        regions = self.region_of[rows]
+        for region in np.unique(regions[valid.any(axis=1)]).tolist():
+            observed_pairs = valid & (regions == region)[:, None]
+            observed = float(np.median(road_hours[observed_pairs] / base[observed_pairs]))
+            self.global_factor += self.LEARNING_RATE * (observed - self.global_factor)
+            if not self.region_learned[region]:
+                self.region_factor[region] = self.global_factor
+                self.region_learned[region] = True
+            self.region_factor[region] += self.LEARNING_RATE * (observed - self.region_factor[region])
+            self._reestimate(self.region_of == region, self.region_factor[region])
+
+        # Origins in regions without road answers of their own follow the global factor
+        unlearned = ~self.region_learned[self.region_of]
+        if unlearned.any():
+            self._reestimate(unlearned, self.global_factor)
+
+    def _reestimate(self, origins: np.ndarray, factor: float) -> None:
+        # Rewrites only these rows' unrefined entries, inside the existing array
+        rows = np.flatnonzero(origins)
+        self.hours[rows] = np.where(self.exact[rows], self.hours[rows], self.base_hours[rows] * factor)
+
+
+class HybridDistanceService(DistanceService):
+    """Geodesic estimates everywhere, road times only for the candidates that matter.
+
+    Nothing is prefetched; JobFinder ranks candidates by estimate and refines the
+    nearest ``refine_batch_size`` at a time until the straight-line lower bound of
+    every unrefined candidate exceeds the best feasible road time found so far. On
+    these matrices the solver always builds with that greedy search and skips regret
+    insertion and ALNS; the remaining stages refine only the legs of the routes and
+    insertions they time, all of them together before timing.
+    """
+
+    def __init__(self, road_service: RoadDistanceService, refine_batch_size: int = 3,
+                 region_size_deg: float = 0.05):
+        self.road_service = road_service
+        self.refine_batch_size = refine_batch_size
+        self.region_size_deg = region_size_deg
+
+    @property
+    def MAX_SPEED_KMH(self) -> float:
+        # Travel times are road times, so the straight-line bound uses the road provider's top speed
+        return self.road_service.MAX_SPEED_KMH
+
+    def calculate_distance_km(self, point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
+        return self.road_service.calculate_distance_km(point1, point2)
+
+    def calculate_travel_time_hours(self, point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
+        return self.road_service.calculate_travel_time_hours(point1, point2)
+
+    def build_travel_time_matrix(self, points: Sequence[Tuple[float, float]]) -> TravelTimeMatrix:
+        points = TravelTimeMatrix.unique_points(points)
+        return RefinableTravelTimeMatrix(points, self.distance_matrix_km(points), self.road_service,
+                                         self.refine_batch_size, self.region_size_deg)
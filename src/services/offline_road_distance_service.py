@@ -0,0 +1,56 @@
+import os
+import numpy as np
+from typing import Optional, Sequence, Tuple
+from .distance_service import DistanceService
+from .road_graph import RoadGraph, ContractionHierarchy
+from .travel_time_matrix import TravelTimeMatrix
+
+
+class OfflineRoadDistanceService(DistanceService):
+    """Road travel times from a local road graph, with no external service.
+
+    Points are snapped to their nearest graph node; the walk/drive from the point to
+    that node is charged at ACCESS_SPEED_KMH. The contraction hierarchy is loaded from
+    ``hierarchy_path`` when it exists, otherwise built (and saved there if a path is given).
+    """
+
+    ACCESS_SPEED_KMH = 15
+    MAX_SPEED_KMH = 130
+
+    def __init__(self, graph_path: str, hierarchy_path: Optional[str] = None):
+        self.graph = RoadGraph.load(graph_path)
+        if hierarchy_path and os.path.exists(hierarchy_path):
+            self.hierarchy = ContractionHierarchy.load(hierarchy_path)
+        else:
+            self.hierarchy = ContractionHierarchy.build(self.graph)
+            if hierarchy_path:
+                self.hierarchy.save(hierarchy_path)
+
+    def calculate_distance_km(self, point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
+        # The graph is weighted by time only; distance stays the geodesic approximation
+        return DistanceService.calculate_distance_km(point1, point2)
+
+    def calculate_travel_time_hours(self, point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
+        return float(self.travel_time_hours([point1], [point2])[0, 0])
+
+    def build_travel_time_matrix(self, points: Sequence[Tuple[float, float]]) -> TravelTimeMatrix:
+        points = TravelTimeMatrix.unique_points(points)
+        hours = self.travel_time_hours(points, points)
+        np.fill_diagonal(hours, 0.0)
+        return TravelTimeMatrix(points, hours)
+
+    def travel_time_hours(self, origins: Sequence[Tuple[float, float]],
+                          destinations: Sequence[Tuple[float, float]]) -> np.ndarray:
+        """Many-to-many travel times in hours; unreachable pairs fall back to geodesic"""
+        origin_nodes, origin_snap_km = self.graph.nearest_nodes(origins)
+        dest_nodes, dest_snap_km = self.graph.nearest_nodes(destinations)
+
+        hours = self.hierarchy.many_to_many(origin_nodes, dest_nodes) / 3600
+        hours += (origin_snap_km[:, None] + dest_snap_km[None, :]) / self.ACCESS_SPEED_KMH
+
+        unreachable = ~np.isfinite(hours)
+        if unreachable.any():
+            geodesic_hours = self.distance_matrix_km(list(origins) + list(destinations)) / self.AVERAGE_SPEED_KMH
+            geodesic_hours = geodesic_hours[:len(origins), len(origins):]
+            hours[unreachable] = geodesic_hours[unreachable]
+        return hours
@@ -1,12 +1,31 @@
 import googlemaps
-from datetime import datetime
-from typing import Tuple, Optional
+import numpy as np
+from datetime import datetime, timedelta
+from typing import List, Tuple, Optional, Sequence
 from .distance_service import DistanceService
+from .travel_time_matrix import TravelTimeMatrix, LIVE_BUCKET, time_bucket
+from .travel_time_cache import TravelTimeCache
+from .circuit_breaker import CircuitBreaker
 
 class RoadDistanceService(DistanceService):
-    def __init__(self, api_key: str):
-        self.gmaps = googlemaps.Client(key=api_key)
-        self._cache = {}
+    # Distance Matrix API limits per request
+    MAX_ORIGINS_PER_REQUEST = 25
+    MAX_DESTINATIONS_PER_REQUEST = 25
+    MAX_ELEMENTS_PER_REQUEST = 100
+    MAX_SPEED_KMH = 110
+
+    def __init__(self, api_key: str, cache: Optional[TravelTimeCache] = None,
+                 breaker: Optional[CircuitBreaker] = None, timeout_seconds: float = 10.0,
+                 failure_ttl_seconds: float = 300.0, bucket_minutes: int = 30):
+        # retry_timeout bounds the client's own retries so one call cannot hang for a minute
+        self.gmaps = googlemaps.Client(key=api_key, timeout=timeout_seconds, retry_timeout=timeout_seconds)
+        self.timeout_seconds = timeout_seconds
+        self.bucket_minutes = bucket_minutes
+        self.breaker = breaker or CircuitBreaker()
+        self._cache = cache if cache is not None else TravelTimeCache()
+        # Negative cache: geodesic estimates for pairs that recently failed, retried after the TTL
+        self._fallback_cache = TravelTimeCache(max_entries=self._cache.max_entries, precision=self._cache.precision,
+                                               ttl_seconds=failure_ttl_seconds)
 
     def calculate_distance_km(self, point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
         distance_km, _ = self._get_distance_and_time(point1, point2)
@@ -16,30 +35,174 @@ class RoadDistanceService(DistanceService):
         _, duration_hours = self._get_distance_and_time(point1, point2)
         return duration_hours
 
-    def _get_distance_and_time(self, origin: Tuple[float, float],
-                               destination: Tuple[float, float]) -> Tuple[float, float]:
-        cache_key = f"{origin}_{destination}"
+    def prefetch(self, points: Sequence[Tuple[float, float]],
+                 departure_times: Optional[Sequence[datetime]] = None) -> None:
+        """Fill the cache for every pair of points (per departure bucket) with batched requests"""
+        points = TravelTimeMatrix.unique_points(points)
+        for departure in departure_times or [None]:
+            self._fetch_missing(points, points, departure)
+
+    def build_travel_time_matrix(self, points: Sequence[Tuple[float, float]]) -> TravelTimeMatrix:
+        """Assemble the matrix from the cache; call prefetch() first to fill it"""
+        points = TravelTimeMatrix.unique_points(points)
+        _, hours = self._assemble_matrix(points, points)
+        return TravelTimeMatrix(points, hours)
+
+    def build_travel_time_profile(self, points: Sequence[Tuple[float, float]], target_date: datetime,
+                                  departure_times: Sequence[datetime]) -> TravelTimeMatrix:
+        """Time-dependent matrix whose buckets are assembled from the cache on first use"""
+        points = TravelTimeMatrix.unique_points(points)
+
+        def load_bucket(departure: datetime) -> np.ndarray:
+            return self._assemble_matrix(points, points, departure)[1]
+
+        return TravelTimeMatrix(points, load_bucket(departure_times[0]), load_bucket,
+                                target_date, self.bucket_minutes)
+
+    def get_matrix(self, origins: Sequence[Tuple[float, float]],
+                   destinations: Sequence[Tuple[float, float]],
+                   departure: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Distances (km) and durations (hours) for every origin/destination pair.
+
+        The problem is tiled into requests of at most MAX_ELEMENTS_PER_REQUEST elements;
+        tiles that are already fully cached are skipped. With a departure time the values
+        are traffic-aware and cached under its time-of-day bucket.
+        """
+        origins = [tuple(o) for o in origins]
+        destinations = [tuple(d) for d in destinations]
+        self._fetch_missing(origins, destinations, departure)
+        return self._assemble_matrix(origins, destinations, departure)
+
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters for the road and fallback caches"""
+        return {"road": self._cache.stats(), "fallback": self._fallback_cache.stats()}
+
+    def circuit_stats(self) -> dict:
+        """Circuit breaker state, failure and timeout counters"""
+        return self.breaker.stats()
+
+    def _bucket_of(self, departure: Optional[datetime]) -> int:
+        return LIVE_BUCKET if departure is None else time_bucket(departure, self.bucket_minutes)
 
-        if cache_key in self._cache:
-            return self._cache[cache_key]
+    def _api_departure_time(self, departure: Optional[datetime]) -> datetime:
+        """The API rejects past departures, so use the same weekday/time in a coming week"""
+        now = datetime.now()
+        if departure is None:
+            return now
+        while departure < now:
+            departure += timedelta(days=7)
+        return departure
 
+    def _fetch_missing(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]],
+                       departure: Optional[datetime] = None) -> None:
+        for tile_origins, tile_destinations in self._missing_tiles(origins, destinations, departure):
+            result = self._request_tile(tile_origins, tile_destinations, departure)
+            if result is None:
+                self._mark_failed(tile_origins, tile_destinations, departure)
+                continue
+            self._store_response(tile_origins, tile_destinations, result, departure)
+
+    def _request_tile(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]],
+                      departure: Optional[datetime] = None) -> Optional[dict]:
+        """One Distance Matrix call guarded by the circuit breaker; None when it fails or is skipped"""
+        if not self.breaker.allow_request():
+            return None
         try:
             result = self.gmaps.distance_matrix(
-                origins=[origin],
-                destinations=[destination],
+                origins=origins,
+                destinations=destinations,
                 mode="driving",
-                departure_time=datetime.now()
+                departure_time=self._api_departure_time(departure)
             )
-
-            if result['rows'][0]['elements'][0]['status'] == 'OK':
-                distance_km = result['rows'][0]['elements'][0]['distance']['value'] / 1000
-                duration_hours = result['rows'][0]['elements'][0]['duration']['value'] / 3600
-                self._cache[cache_key] = (distance_km, duration_hours)
-                return distance_km, duration_hours
+        except googlemaps.exceptions.Timeout:
+            print(f"Google Maps API timeout after {self.timeout_seconds}s")
+            self.breaker.record_failure(timeout=True)
+            return None
         except Exception as e:
             print(f"Google Maps API error: {e}")
+            self.breaker.record_failure()
+            return None
+        self.breaker.record_success()
+        return result
+
+    def _mark_failed(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]],
+                     departure: Optional[datetime] = None) -> None:
+        """Negatively cache uncached pairs so they use the geodesic path until the TTL passes"""
+        bucket = self._bucket_of(departure)
+        for origin in origins:
+            for destination in destinations:
+                if origin != destination and not self._cache.contains(origin, destination, bucket):
+                    self._fallback(origin, destination, bucket)
+
+    def _missing_tiles(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]],
+                       departure: Optional[datetime] = None):
+        """Request-sized (origins, destinations) tiles that still have uncached pairs"""
+        bucket = self._bucket_of(departure)
+        dest_step = min(len(destinations), self.MAX_DESTINATIONS_PER_REQUEST) or 1
+        origin_step = max(1, min(self.MAX_ORIGINS_PER_REQUEST, self.MAX_ELEMENTS_PER_REQUEST // dest_step))
+
+        for i in range(0, len(origins), origin_step):
+            for j in range(0, len(destinations), dest_step):
+                tile_origins = origins[i:i + origin_step]
+                tile_destinations = destinations[j:j + dest_step]
+                if any(o != d and not self._cache.contains(o, d, bucket)
+                       and not self._fallback_cache.contains(o, d, bucket)
+                       for o in tile_origins for d in tile_destinations):
+                    yield tile_origins, tile_destinations
+
+    def _store_response(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]],
+                        result: dict, departure: Optional[datetime] = None) -> None:
+        bucket = self._bucket_of(departure)
+        fetched = []
+        for origin, row in zip(origins, result['rows']):
+            for destination, element in zip(destinations, row['elements']):
+                if element['status'] == 'OK':
+                    distance_km = element['distance']['value'] / 1000
+                    duration_hours = element['duration']['value'] / 3600
+                    fetched.append((origin, destination, (distance_km, duration_hours)))
+                elif origin != destination:
+                    self._fallback(origin, destination, bucket)
+        self._cache.set_many(fetched, bucket)
+
+    def _assemble_matrix(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]],
+                         departure: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Read every pair from the cache, using the geodesic fallback for gaps"""
+        bucket = self._bucket_of(departure)
+        distances = np.zeros((len(origins), len(destinations)))
+        durations = np.zeros((len(origins), len(destinations)))
+        for i, origin in enumerate(origins):
+            for j, destination in enumerate(destinations):
+                if origin == destination:
+                    continue
+                cached = self._cache.get(origin, destination, bucket)
+                if cached is None:
+                    cached = self._fallback(origin, destination, bucket)
+                distances[i, j], durations[i, j] = cached
+        return distances, durations
+
+    def _get_distance_and_time(self, origin: Tuple[float, float],
+                               destination: Tuple[float, float]) -> Tuple[float, float]:
+        cached = self._cache.get(origin, destination)
+        if cached is not None:
+            return cached
+
+        cached = self._fallback_cache.get(origin, destination)
+        if cached is not None:
+            return cached
+
+        self._fetch_missing([origin], [destination])
+        cached = self._cache.get(origin, destination)
+        if cached is not None:
+            return cached
+        return self._fallback(origin, destination)
 
+    def _fallback(self, origin: Tuple[float, float], destination: Tuple[float, float],
+                  bucket: int = LIVE_BUCKET) -> Tuple[float, float]:
+        cached = self._fallback_cache.get(origin, destination, bucket)
+        if cached is not None:
+            return cached
 
         distance_km = super().calculate_distance_km(origin, destination)
         duration_hours = super().calculate_travel_time_hours(origin, destination)
-        return distance_km, duration_hours
\ No newline at end of file
+        self._fallback_cache.set(origin, destination, (distance_km, duration_hours), bucket)
+        return distance_km, duration_hours
@@ -0,0 +1,228 @@
+import heapq
+import numpy as np
+from typing import Dict, List, Sequence, Tuple
+
+
+class RoadGraph:
+    """Directed road graph in compressed sparse row (CSR) form.
+
+    Stored as an .npz file with:
+      coords  (n, 2) float64  node latitude/longitude
+      indptr  (n + 1,) int64  edges of node u are indices[indptr[u]:indptr[u + 1]]
+      indices (m,) int32      edge head nodes
+      weights (m,) float32    edge travel times in seconds
+    """
+
+    def __init__(self, coords: np.ndarray, indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray):
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.coords)
+
+    @classmethod
+    def from_edges(cls, coords: np.ndarray, tails: Sequence[int], heads: Sequence[int],
+                   seconds: Sequence[float]) -> "RoadGraph":
+        """Build the CSR arrays from an edge list (e.g. converted from an OSM extract)"""
+        tails = np.asarray(tails, dtype=np.int64)
+        order = np.argsort(tails, kind="stable")
+        counts = np.bincount(tails, minlength=len(coords))
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return cls(coords, indptr, np.asarray(heads)[order], np.asarray(seconds)[order])
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        data = np.load(path)
+        return cls(data["coords"], data["indptr"], data["indices"], data["weights"])
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, coords=self.coords, indptr=self.indptr,
+                            indices=self.indices, weights=self.weights)
+
+    def nearest_nodes(self, points: Sequence[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Snap points to their nearest graph node; returns (node ids, snap distances in km)"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        km_per_deg = 111.195
+        cos_lat = np.cos(np.radians(self.coords[:, 0].mean())) if self.node_count else 1.0
+        nodes = np.empty(len(points), dtype=np.int64)
+        dists = np.empty(len(points))
+
+        # Chunk so the (points x nodes) distance block stays small on large graphs
+        chunk = max(1, 2_000_000 // max(1, self.node_count))
+        for start in range(0, len(points), chunk):
+            block = points[start:start + chunk]
+            dlat = (block[:, None, 0] - self.coords[None, :, 0]) * km_per_deg
+            dlng = (block[:, None, 1] - self.coords[None, :, 1]) * km_per_deg * cos_lat
+            sq = dlat ** 2 + dlng ** 2
+            best = np.argmin(sq, axis=1)
+            nodes[start:start + chunk] = best
+            dists[start:start + chunk] = np.sqrt(sq[np.arange(len(block)), best])
+        return nodes, dists
+
+
+class ContractionHierarchy:
+    """Contraction hierarchy over a RoadGraph with bucket-based many-to-many queries.
+
+    Preprocessing contracts nodes in order of importance, adding shortcuts where no
+    witness path exists. Queries then only relax edges towards higher-ranked nodes:
+    a backward upward search from every target fills per-node buckets, and a forward
+    upward search from every source scans them.
+    """
+
+    WITNESS_SETTLE_LIMIT = 60
+
+    def __init__(self, rank: np.ndarray, forward: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                 backward: Tuple[np.ndarray, np.ndarray, np.ndarray]):
+        self.rank = rank
+        self.forward = forward
+        self.backward = backward
+
+    @classmethod
+    def load(cls, path: str) -> "ContractionHierarchy":
+        data = np.load(path)
+        return cls(data["rank"],
+                   (data["fwd_indptr"], data["fwd_indices"], data["fwd_weights"]),
+                   (data["bwd_indptr"], data["bwd_indices"], data["bwd_weights"]))
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, rank=self.rank,
+                            fwd_indptr=self.forward[0], fwd_indices=self.forward[1], fwd_weights=self.forward[2],
+                            bwd_indptr=self.backward[0], bwd_indices=self.backward[1], bwd_weights=self.backward[2])
+
+    @classmethod
+    def build(cls, graph: RoadGraph) -> "ContractionHierarchy":
+        n = graph.node_count
+        out_edges: List[Dict[int, float]] = [dict() for _ in range(n)]
+        in_edges: List[Dict[int, float]] = [dict() for _ in range(n)]
+        for u in range(n):
+            for k in range(graph.indptr[u], graph.indptr[u + 1]):
+                v, w = int(graph.indices[k]), float(graph.weights[k])
+                if u != v and w < out_edges[u].get(v, float("inf")):
+                    out_edges[u][v] = w
+                    in_edges[v][u] = w
+
+        contracted = np.zeros(n, dtype=bool)
+        deleted_neighbors = np.zeros(n, dtype=np.int64)
+        rank = np.empty(n, dtype=np.int64)
+        up_forward: List[Tuple[int, int, float]] = []
+        up_backward: List[Tuple[int, int, float]] = []
+
+        def shortcuts_for(v: int) -> List[Tuple[int, int, float]]:
+            needed = []
+            for u, w_uv in in_edges[v].items():
+                targets = {x: w_uv + w_vx for x, w_vx in out_edges[v].items() if x != u}
+                if not targets:
+                    continue
+                witness = cls._witness_search(out_edges, u, v, targets, max(targets.values()))
+                for x, via in targets.items():
+                    if witness.get(x, float("inf")) > via:
+                        needed.append((u, x, via))
+            return needed
+
+        def priority(v: int) -> int:
+            removed = len(in_edges[v]) + len(out_edges[v])
+            return len(shortcuts_for(v)) - removed + deleted_neighbors[v]
+
+        queue = [(priority(v), v) for v in range(n)]
+        heapq.heapify(queue)
+        next_rank = 0
+        while queue:
+            _, v = heapq.heappop(queue)
+            if contracted[v]:
+                continue
+            # Lazy update: re-queue if the node became less attractive since it was pushed
+            current = priority(v)
+            if queue and current > queue[0][0]:
+                heapq.heappush(queue, (current, v))
+                continue
+
+            for u, x, w in shortcuts_for(v):
+                if w < out_edges[u].get(x, float("inf")):
+                    out_edges[u][x] = w
+                    in_edges[x][u] = w
+
+            rank[v] = next_rank
+            next_rank += 1
+            contracted[v] = True
+            for x, w in out_edges[v].items():
+                up_forward.append((v, x, w))
+                del in_edges[x][v]
+                deleted_neighbors[x] += 1
+            for u, w in in_edges[v].items():
+                up_backward.append((v, u, w))
+                del out_edges[u][v]
+                deleted_neighbors[u] += 1
+            out_edges[v].clear()
+            in_edges[v].clear()
+
+        return cls(rank, cls._to_csr(n, up_forward), cls._to_csr(n, up_backward))
+
+    @staticmethod
+    def _witness_search(out_edges: List[Dict[int, float]], source: int, skip: int,
+                        targets: Dict[int, float], limit: float) -> Dict[int, float]:
+        """Bounded Dijkstra from source that avoids the node being contracted"""
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        remaining = set(targets)
+        while heap and remaining and settled < ContractionHierarchy.WITNESS_SETTLE_LIMIT:
+            d, u = heapq.heappop(heap)
+            if d > dist.get(u, float("inf")) or d > limit:
+                continue
+            settled += 1
+            remaining.discard(u)
+            for x, w in out_edges[u].items():
+                if x == skip:
+                    continue
+                nd = d + w
+                if nd < dist.get(x, float("inf")):
+                    dist[x] = nd
+                    heapq.heappush(heap, (nd, x))
+        return dist
+
+    @staticmethod
+    def _to_csr(n: int, edges: List[Tuple[int, int, float]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if not edges:
+            return np.zeros(n + 1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        tails, heads, weights = (np.asarray(c) for c in zip(*edges))
+        order = np.argsort(tails, kind="stable")
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(tails, minlength=n))))
+        return indptr, heads[order].astype(np.int32), weights[order].astype(np.float32)
+
+    @staticmethod
+    def _upward_search(csr: Tuple[np.ndarray, np.ndarray, np.ndarray], source: int) -> Dict[int, float]:
+        indptr, indices, weights = csr
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = {}
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled[u] = d
+            for k in range(indptr[u], indptr[u + 1]):
+                x = int(indices[k])
+                nd = d + float(weights[k])
+                if nd < dist.get(x, float("inf")):
+                    dist[x] = nd
+                    heapq.heappush(heap, (nd, x))
+        return settled
+
+    def many_to_many(self, sources: Sequence[int], targets: Sequence[int]) -> np.ndarray:
+        """Shortest travel times (seconds) between every source and target node"""
+        buckets: Dict[int, List[Tuple[int, float]]] = {}
+        for j, t in enumerate(targets):
+            for v, d in self._upward_search(self.backward, int(t)).items():
+                buckets.setdefault(v, []).append((j, d))
+
+        result = np.full((len(sources), len(targets)), np.inf)
+        for i, s in enumerate(sources):
+            row = result[i]
+            for v, d in self._upward_search(self.forward, int(s)).items():
+                for j, dt in buckets.get(v, ()):
+                    if d + dt < row[j]:
+                        row[j] = d + dt
+        return result
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from src.models.cleaner import Cleaner
+from src.models.job import Job
+from src.models.schedule import ScheduleJobInfo, ScheduleJobStatus, ScheduleOptimizationResult
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds its maximum of unfinished jobs"""
+
+
+class _QueuedJob:
+    """One solve, shared by every submission that joined it"""
+
+    __slots__ = ("key", "task", "stop", "status", "started_at", "subscribers")
+
+    def __init__(self, key: Optional[str]):
+        self.key = key
+        self.task: Optional[asyncio.Task] = None
+        self.stop = threading.Event()
+        self.status = ScheduleJobStatus.QUEUED
+        self.started_at: Optional[datetime] = None
+        # Submissions still waiting for this solve, by their job id
+        self.subscribers: Dict[str, "_Subscription"] = {}
+
+
+class _Subscription:
+    """One submission's view of a solve: its own job id, status and completion"""
+
+    __slots__ = ("info", "job", "done")
+
+    def __init__(self, info: ScheduleJobInfo, job: _QueuedJob):
+        self.info = info
+        self.job = job
+        self.done = asyncio.Event()
+
+    def finish(self, status: ScheduleJobStatus) -> None:
+        self.info.status = status
+        self.info.finished_at = datetime.now()
+        self.done.set()
+
+
+class ScheduleJobQueue:
+    """Runs schedule generation in the background and keeps the outcome for polling.
+
+    ``submit`` returns at once with a job id. Jobs wait for one of ``max_concurrent``
+    slots and then solve on a thread pool of that size, so the event loop keeps serving
+    requests meanwhile. At most ``max_pending`` solves may be queued or running; finished
+    jobs stay available for polling, the oldest dropped beyond ``max_finished``.
+    Submissions with the same ``key`` as an unfinished solve join it, each under its own
+    job id. Cancelling a job only withdraws that submission; the solve stops when its
+    last submission is withdrawn. A queued solve is then dropped; a running one turns
+    ``cancelling`` at once and is asked to stop, which ends the solve after its current
+    stage. Its result is discarded and it is ``cancelled`` once the solver has returned
+    and freed its slot.
+    """
+
+    MAX_WAIT_SECONDS = 60.0
+
+    def __init__(self, service, max_concurrent: int = 1, max_pending: int = 16, max_finished: int = 100):
+        self.service = service
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="schedule-job")
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._solves: List[_QueuedJob] = []
+        self._jobs: "OrderedDict[str, _Subscription]" = OrderedDict()
+
+    def submit(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+               time_budget_seconds: Optional[float] = None, key: Optional[str] = None) -> ScheduleJobInfo:
+        """Queue a schedule for the day, or join the unfinished solve already queued under ``key``.
+
+        Must be called from the event loop.
+        """
+        job = None
+        if key is not None:
+            # A solve that is being stopped is not joined
+            job = next((solve for solve in self._solves if solve.key == key and not solve.stop.is_set()), None)
+        if job is None:
+            if len(self._solves) >= self.max_pending:
+                raise QueueFullError(f"{len(self._solves)} schedule jobs are already queued or running")
+            job = _QueuedJob(key)
+            self._solves.append(job)
+            job.task = asyncio.get_running_loop().create_task(self._run(job, cleaners, jobs, target_date,
+                                                                        time_budget_seconds))
+
+        info = ScheduleJobInfo(id=uuid4().hex, status=job.status, target_date=target_date,
+                               submitted_at=datetime.now(), started_at=job.started_at)
+        subscription = job.subscribers[info.id] = self._jobs[info.id] = _Subscription(info, job)
+        return subscription.info
+
+    def get(self, job_id: str) -> Optional[ScheduleJobInfo]:
+        subscription = self._jobs.get(job_id)
+        return subscription.info if subscription else None
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[ScheduleJobInfo]:
+        """The job once it has finished, or as it is when ``timeout`` seconds pass first"""
+        subscription = self._jobs.get(job_id)
+        if subscription is None:
+            return None
+        try:
+            await asyncio.wait_for(subscription.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return subscription.info
+
+    def cancel(self, job_id: str) -> Optional[ScheduleJobInfo]:
+        subscription = self._jobs.get(job_id)
+        if subscription is None:
+            return None
+        job = subscription.job
+        if subscription.info.is_finished or job_id not in job.subscribers:
+            return subscription.info
+
+        if len(job.subscribers) > 1:
+            # Others still wait for this solve; only this submission is withdrawn
+            del job.subscribers[job_id]
+            subscription.finish(ScheduleJobStatus.CANCELLED)
+            self._prune()
+        elif job.status == ScheduleJobStatus.QUEUED:
+            # A task cancelled before its first step never runs its cleanup, so finish it here
+            job.task.cancel()
+            self._finish(job, ScheduleJobStatus.CANCELLED)
+        elif job.status == ScheduleJobStatus.RUNNING:
+            job.stop.set()
+            self._set_status(job, ScheduleJobStatus.CANCELLING)
+        return subscription.info
+
+    def close(self) -> None:
+        for job in self._solves:
+            job.stop.set()
+            if job.task is not None:
+                job.task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, job: _QueuedJob, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                   time_budget_seconds: Optional[float]) -> None:
+        status, result, error = ScheduleJobStatus.FAILED, None, None
+        try:
+            async with self._slots:
+                job.started_at = datetime.now()
+                self._set_status(job, ScheduleJobStatus.RUNNING)
+                # The time budget starts once the job runs, not while it waits in the queue
+                result = await self.service.create_schedule_async(cleaners, jobs, target_date,
+                                                                  time_budget_seconds, executor=self._executor,
+                                                                  stop=job.stop)
+            if job.stop.is_set():
+                status, result = ScheduleJobStatus.CANCELLED, None
+            else:
+                status = ScheduleJobStatus.SUCCEEDED
+        except asyncio.CancelledError:
+            status = ScheduleJobStatus.CANCELLED
+        except Exception as e:
+            print(f"Schedule job failed: {e}")
+            error = str(e)
+        finally:
+            self._finish(job, status, result, error)
+
+    def _finish(self, job: _QueuedJob, status: ScheduleJobStatus, result: Optional[ScheduleOptimizationResult] = None,
+                error: Optional[str] = None) -> None:
+        if job not in self._solves:
+            return
+        self._solves.remove(job)
+        for subscription in job.subscribers.values():
+            subscription.info.result = result
+            subscription.info.error = error
+            subscription.finish(status)
+        self._prune()
+
+    @staticmethod
+    def _set_status(job: _QueuedJob, status: ScheduleJobStatus) -> None:
+        job.status = status
+        for subscription in job.subscribers.values():
+            subscription.info.status = status
+            subscription.info.started_at = job.started_at
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, subscription in self._jobs.items() if subscription.info.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
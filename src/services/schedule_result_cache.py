@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import threading
+import time as _time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from src.models.cleaner import Cleaner
+from src.models.job import Job
+from src.models.schedule import ScheduleOptimizationResult
+
+
+class ScheduleResultCache:
+    """Bounded cache of optimization results keyed by a hash of everything that shaped them.
+
+    The key covers the cleaners, jobs, target date, settings and any extra solver
+    arguments, so a change to any of them misses instead of returning an outdated
+    schedule. Entries are fresh for ``ttl_seconds`` (forever when None); after that
+    ``get_or_compute_async`` either recomputes or, with ``serve_stale``, returns the old
+    result at once and refreshes it in the background. Concurrent requests for a key
+    that is being computed wait for that computation (single flight). The least
+    recently used entry is evicted beyond ``max_entries``; ``invalidate`` drops entries
+    explicitly when the underlying data changes.
+    """
+
+    def __init__(self, max_entries: int = 32, ttl_seconds: Optional[float] = None, serve_stale: bool = False):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.serve_stale = serve_stale
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        # key -> (result, target day, fresh until)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._generation = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(cleaners: List[Cleaner], jobs: List[Job], target_date: datetime, config, *extra) -> str:
+        """Content hash of a solver call; list order is part of it because it steers the solver"""
+        digest = hashlib.sha256()
+        digest.update(f"{target_date.date().isoformat()}|{config.model_dump_json()}|{extra!r};".encode())
+        for cleaner in cleaners:
+            digest.update(cleaner.model_dump_json().encode())
+        digest.update(b";")
+        for job in jobs:
+            digest.update(job.model_dump_json().encode())
+        return digest.hexdigest()
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[ScheduleOptimizationResult]:
+        """Cached result, or None when missing or (unless ``allow_stale``) expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (not allow_stale and entry[2] <= _time.time()):
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, target_date: datetime, result: ScheduleOptimizationResult) -> None:
+        fresh_until = _time.time() + self.ttl_seconds if self.ttl_seconds is not None else float('inf')
+        with self._lock:
+            self._entries[key] = (result, target_date.date(), fresh_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, target_date: Optional[date] = None) -> int:
+        """Drop every entry, or only those for one day; returns how many were dropped"""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if target_date is None or entry[1] == target_date]
+            for key in keys:
+                del self._entries[key]
+            self._generation += 1
+            return len(keys)
+
+    async def get_or_compute_async(self, key: str, target_date: datetime,
+                                   compute: Callable[[], Awaitable[ScheduleOptimizationResult]]
+                                   ) -> ScheduleOptimizationResult:
+        """Cached result for ``key``, computing and storing it when missing or expired.
+
+        Concurrent calls for the same key share one computation instead of each starting
+        their own.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and entry[2] > _time.time():
+            self.hits += 1
+            return entry[0]
+        if entry is not None and self.serve_stale:
+            self.stale_hits += 1
+            self._computation(key, target_date, compute).add_done_callback(self._report_refresh_failure)
+            return entry[0]
+
+        self.misses += 1
+        # A caller that goes away (e.g. a closed connection) must not cancel the shared computation
+        return await asyncio.shield(self._computation(key, target_date, compute))
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _computation(self, key: str, target_date: datetime,
+                     compute: Callable[[], Awaitable[ScheduleOptimizationResult]]) -> asyncio.Future:
+        """The in-flight computation for ``key``, started if there is none"""
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future
+
+        generation = self._generation
+
+        async def run():
+            try:
+                result = await compute()
+                with self._lock:
+                    # An invalidation while computing means the data changed; don't cache the old answer
+                    if self._generation == generation:
+                        self.set(key, target_date, result)
+                return result
+            finally:
+                self._in_flight.pop(key, None)
+
+        future = self._in_flight[key] = asyncio.ensure_future(run())
+        return future
+
+    @staticmethod
+    def _report_refresh_failure(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Background schedule refresh failed: {future.exception()}")
@@ -0,0 +1,299 @@
+import math
+import random
+import threading
+import time as timer
+import numpy as np
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from src.models.cleaner import Cleaner
+from src.models.job import Job
+from src.models.schedule import DailySchedule
+from .optimization_scorer import OptimizationScorer
+from .regret_insertion import InsertionState, RegretInsertionBuilder
+from .route_evaluator import RouteEvaluator, RouteTiming
+
+
+class Solution:
+    """Routes as job indices with their timings, and the OptimizationScorer score"""
+
+    def __init__(self, routes: List[List[int]], timings: List[RouteTiming], job_count: int):
+        self.routes = routes
+        self.timings = timings
+        assigned = sum(len(route) for route in routes)
+        work = [t.total_work_hours for t in timings]
+        mean = sum(work) / len(work) if work else 0.0
+        self.score = (sum(t.total_travel_hours for t in timings)
+                      + (job_count - assigned) * OptimizationScorer.UNASSIGNED_PENALTY
+                      + sum((h - mean) ** 2 for h in work) * OptimizationScorer.BALANCE_WEIGHT)
+
+
+class AlnsOptimizer:
+    """Adaptive Large Neighbourhood Search over complete schedules, bounded by a budget.
+
+    Every iteration removes some jobs (random, worst-travel or related removal),
+    reinserts removed and unassigned jobs (greedy or regret insertion) and accepts the
+    result by simulated annealing. Operators are picked by roulette over weights that
+    adapt every SEGMENT_LENGTH iterations to how often each one produced a new best,
+    an improvement or an accepted move. The search stops when the deadline passes or
+    the iteration budget is used up, and always returns the best solution seen.
+    """
+
+    SEGMENT_LENGTH = 50
+    REACTION = 0.2
+    REWARD_BEST, REWARD_BETTER, REWARD_ACCEPTED = 33.0, 9.0, 13.0
+    MIN_REMOVALS, MAX_REMOVALS = 2, 40
+    REMOVAL_FRACTION = 0.25
+    WORST_REMOVAL_RANDOMNESS = 3.0
+    # Start accepting a 5% worse solution with probability 0.5, cooling to 0.5% at the end
+    START_WORSENING, END_WORSENING = 0.05, 0.005
+
+    def __init__(self, config, regret_builder: Optional[RegretInsertionBuilder] = None, seed: int = 0):
+        self.config = config
+        self.regret_builder = regret_builder or RegretInsertionBuilder(config)
+        self.seed = seed
+
+    def optimize(self, schedules: List[DailySchedule], cleaners: List[Cleaner], jobs: List[Job],
+                 target_date: datetime, evaluator: RouteEvaluator, deadline: Optional[float] = None,
+                 max_iterations: Optional[int] = None,
+                 seed: Optional[int] = None,
+                 stop: Optional[threading.Event] = None) -> Tuple[List[DailySchedule], List[Job]]:
+        """Best schedules found and their unassigned jobs (in ``jobs`` order).
+
+        ``deadline`` is a time.perf_counter() value. With neither a deadline nor an
+        iteration budget the schedules are returned unchanged. Setting ``stop`` ends the
+        search early, as if the budget had run out.
+        """
+        search, initial = self._start(schedules, cleaners, jobs, evaluator, seed)
+        best = search.run(initial, deadline, max_iterations, stop)
+        return search.result(best, schedules, target_date)
+
+    def optimize_steps(self, schedules: List[DailySchedule], cleaners: List[Cleaner], jobs: List[Job],
+                       target_date: datetime, evaluator: RouteEvaluator, deadline: Optional[float] = None,
+                       max_iterations: Optional[int] = None, seed: Optional[int] = None,
+                       stop: Optional[threading.Event] = None) -> Iterator[Tuple[List[DailySchedule], List[Job]]]:
+        """Like optimize, but yields the schedules and unassigned jobs of every new best solution.
+
+        Schedules of routes that did not change since the previous yield are the same
+        objects, so callers can tell what changed by identity.
+        """
+        search, initial = self._start(schedules, cleaners, jobs, evaluator, seed)
+        for best in search.run_steps(initial, deadline, max_iterations, stop):
+            schedules, unassigned = search.result(best, schedules, target_date)
+            yield schedules, unassigned
+
+    def _start(self, schedules: List[DailySchedule], cleaners: List[Cleaner], jobs: List[Job],
+               evaluator: RouteEvaluator, seed: Optional[int]) -> Tuple["_Search", Solution]:
+        index_of = {job.id: k for k, job in enumerate(jobs)}
+        cleaners_by_id = {c.id: c for c in cleaners}
+        cleaners = [cleaners_by_id[s.cleaner_id] for s in schedules]
+        routes = [[index_of[a.job_id] for a in s.assignments] for s in schedules]
+        timings = [evaluator.simulate(c, [jobs[j] for j in route]) for c, route in zip(cleaners, routes)]
+
+        eligible = evaluator.compile(cleaners, jobs).eligible.copy()
+        # Routes the evaluator cannot reproduce are kept exactly as built
+        frozen = [r for r, timing in enumerate(timings) if timing is None]
+        for r in frozen:
+            eligible[:, r] = False
+            timings[r] = RouteTiming([], [], [], 0.0, 0.0)
+        frozen_routes = {r: routes[r] for r in frozen}
+        for r in frozen:
+            routes[r] = []
+
+        search = _Search(self, cleaners, jobs, evaluator, eligible, frozen_routes,
+                         self.seed if seed is None else seed)
+        return search, Solution(routes, timings, len(jobs) - len(search.frozen_jobs))
+
+
+class _Search:
+    def __init__(self, optimizer: AlnsOptimizer, cleaners: List[Cleaner], jobs: List[Job],
+                 evaluator: RouteEvaluator, eligible: np.ndarray, frozen_routes: Dict[int, List[int]], seed: int):
+        self.optimizer = optimizer
+        self.cleaners = cleaners
+        self.jobs = jobs
+        self.evaluator = evaluator
+        self.eligible = eligible
+        self.frozen_routes = frozen_routes
+        self.frozen_jobs: Set[int] = {j for route in frozen_routes.values() for j in route}
+        self.rng = random.Random(seed)
+        self.points = evaluator.compile(cleaners, jobs).point
+
+        self.destroy_operators: List[Callable[[Solution, int], List[int]]] = [
+            self._random_removal, self._worst_removal, self._related_removal]
+        self.repair_operators: List[int] = [1, 2, 3]  # regret-k of each repair; 1 is greedy
+        self.destroy_weights = [1.0] * len(self.destroy_operators)
+        self.repair_weights = [1.0] * len(self.repair_operators)
+
+    def run(self, current: Solution, deadline: Optional[float], max_iterations: Optional[int],
+            stop: Optional[threading.Event] = None) -> Solution:
+        best = current
+        for best in self.run_steps(current, deadline, max_iterations, stop):
+            pass
+        return best
+
+    def run_steps(self, current: Solution, deadline: Optional[float], max_iterations: Optional[int],
+                  stop: Optional[threading.Event] = None) -> Iterator[Solution]:
+        """Search from ``current``, yielding each new best solution"""
+        if deadline is None and max_iterations is None:
+            return
+        best = current
+        start = timer.perf_counter()
+        start_temperature = self._temperature_for(current.score, self.optimizer.START_WORSENING)
+        end_temperature = self._temperature_for(current.score, self.optimizer.END_WORSENING)
+        destroy_scores = [0.0] * len(self.destroy_operators)
+        repair_scores = [0.0] * len(self.repair_operators)
+        destroy_uses = [0] * len(self.destroy_operators)
+        repair_uses = [0] * len(self.repair_operators)
+
+        iteration = 0
+        while True:
+            now = timer.perf_counter()
+            if deadline is not None and now >= deadline:
+                break
+            if max_iterations is not None and iteration >= max_iterations:
+                break
+            if stop is not None and stop.is_set():
+                break
+            progress = self._progress(iteration, max_iterations, now - start,
+                                      None if deadline is None else deadline - start)
+            temperature = start_temperature * (end_temperature / start_temperature) ** progress \
+                if start_temperature > 0 else 0.0
+
+            d = self._roulette(self.destroy_weights)
+            r = self._roulette(self.repair_weights)
+            candidate = self._repair(self._destroy(current, d), self.repair_operators[r])
+
+            reward = 0.0
+            if candidate.score < best.score - 1e-9:
+                best = current = candidate
+                reward = self.optimizer.REWARD_BEST
+                yield best
+            elif candidate.score < current.score - 1e-9:
+                current = candidate
+                reward = self.optimizer.REWARD_BETTER
+            elif temperature > 0 and self.rng.random() < math.exp((current.score - candidate.score) / temperature):
+                current = candidate
+                reward = self.optimizer.REWARD_ACCEPTED
+            destroy_scores[d] += reward
+            repair_scores[r] += reward
+            destroy_uses[d] += 1
+            repair_uses[r] += 1
+
+            iteration += 1
+            if iteration % self.optimizer.SEGMENT_LENGTH == 0:
+                self._adapt(self.destroy_weights, destroy_scores, destroy_uses)
+                self._adapt(self.repair_weights, repair_scores, repair_uses)
+
+    def result(self, best: Solution, schedules: List[DailySchedule],
+               target_date: datetime) -> Tuple[List[DailySchedule], List[Job]]:
+        """Schedules for a solution (reusing those in ``schedules`` whose route is unchanged)
+        and its unassigned jobs in ``jobs`` order"""
+        result = []
+        for r, (schedule, cleaner) in enumerate(zip(schedules, self.cleaners)):
+            route = best.routes[r]
+            if r in self.frozen_routes or [a.job_id for a in schedule.assignments] == [self.jobs[j].id for j in route]:
+                result.append(schedule)
+            else:
+                result.append(self.evaluator.to_schedule(cleaner, [self.jobs[j] for j in route],
+                                                         best.timings[r], target_date))
+        assigned = {j for route in best.routes for j in route} | self.frozen_jobs
+        return result, [job for k, job in enumerate(self.jobs) if k not in assigned]
+
+    def _destroy(self, solution: Solution, operator: int) -> Tuple[List[List[int]], List[RouteTiming], List[int]]:
+        assigned = sum(len(route) for route in solution.routes)
+        if not assigned:
+            return list(solution.routes), list(solution.timings), []
+        upper = max(self.optimizer.MIN_REMOVALS,
+                    min(self.optimizer.MAX_REMOVALS, int(assigned * self.optimizer.REMOVAL_FRACTION)))
+        count = self.rng.randint(min(self.optimizer.MIN_REMOVALS, assigned), min(upper, assigned))
+        removed = set(self.destroy_operators[operator](solution, count))
+
+        routes, timings = list(solution.routes), list(solution.timings)
+        for r, route in enumerate(solution.routes):
+            if not removed.intersection(route):
+                continue
+            kept = [j for j in route if j not in removed]
+            timing = self.evaluator.simulate(self.cleaners[r], [self.jobs[j] for j in kept])
+            if timing is None:
+                # Removing jobs moved lunch onto a job it now blocks; leave this route alone
+                removed.difference_update(route)
+                continue
+            routes[r], timings[r] = kept, timing
+        return routes, timings, sorted(removed)
+
+    def _repair(self, destroyed: Tuple[List[List[int]], List[RouteTiming], List[int]], regret_k: int) -> Solution:
+        routes, timings, removed = destroyed
+        open_jobs = np.zeros(len(self.jobs), dtype=bool)
+        open_jobs[removed] = True
+        assigned = {j for route in routes for j in route}
+        for j in range(len(self.jobs)):
+            if j not in assigned and j not in self.frozen_jobs:
+                open_jobs[j] = True
+        state = InsertionState(self.cleaners, self.jobs, self.evaluator, self.eligible,
+                               [list(route) for route in routes], list(timings), np.flatnonzero(open_jobs))
+        self.optimizer.regret_builder.insert(state, regret_k)
+        return Solution(state.routes, state.timings, len(self.jobs) - len(self.frozen_jobs))
+
+    def _random_removal(self, solution: Solution, count: int) -> List[int]:
+        return self.rng.sample([j for route in solution.routes for j in route], count)
+
+    def _worst_removal(self, solution: Solution, count: int) -> List[int]:
+        """Jobs whose removal saves the most travel, with some randomness"""
+        hours = self.evaluator.travel_matrix.hours
+        savings = []
+        for route in solution.routes:
+            points = self.points[route].tolist()
+            for k, j in enumerate(route):
+                saved = 0.0
+                if k > 0:
+                    saved += hours[points[k - 1], points[k]]
+                if k + 1 < len(route):
+                    saved += hours[points[k], points[k + 1]]
+                if 0 < k < len(route) - 1:
+                    saved -= hours[points[k - 1], points[k + 1]]
+                savings.append((float(saved), j))
+        savings.sort(reverse=True)
+
+        removed = []
+        while len(removed) < count:
+            pick = int(len(savings) * self.rng.random() ** self.optimizer.WORST_REMOVAL_RANDOMNESS)
+            removed.append(savings.pop(pick)[1])
+        return removed
+
+    def _related_removal(self, solution: Solution, count: int) -> List[int]:
+        """A random job and the assigned jobs closest to it"""
+        assigned = np.asarray([j for route in solution.routes for j in route], dtype=np.int64)
+        seed = self.points[assigned[self.rng.randrange(len(assigned))]]
+        hours = self.evaluator.travel_matrix.hours
+        closeness = hours[seed, self.points[assigned]] + hours[self.points[assigned], seed]
+        nearest = np.argpartition(closeness, count - 1)[:count] if count < len(assigned) else np.arange(len(assigned))
+        return assigned[nearest].tolist()
+
+    def _roulette(self, weights: List[float]) -> int:
+        pick = self.rng.random() * sum(weights)
+        for k, weight in enumerate(weights):
+            pick -= weight
+            if pick <= 0:
+                return k
+        return len(weights) - 1
+
+    def _adapt(self, weights: List[float], scores: List[float], uses: List[int]) -> None:
+        reaction = self.optimizer.REACTION
+        for k in range(len(weights)):
+            if uses[k]:
+                weights[k] = max(0.05, (1 - reaction) * weights[k] + reaction * scores[k] / uses[k])
+            scores[k], uses[k] = 0.0, 0
+
+    @staticmethod
+    def _temperature_for(score: float, worsening: float) -> float:
+        # A solution worse by ``worsening`` of the score is accepted with probability 0.5
+        return worsening * score / math.log(2) if score > 0 else 0.0
+
+    @staticmethod
+    def _progress(iteration: int, max_iterations: Optional[int], elapsed: float,
+                  time_budget: Optional[float]) -> float:
+        fractions = []
+        if max_iterations:
+            fractions.append(iteration / max_iterations)
+        if time_budget:
+            fractions.append(elapsed / time_budget)
+        return min(1.0, max(fractions)) if fractions else 0.0
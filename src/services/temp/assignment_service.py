@@ -1,70 +1,434 @@
-from datetime import datetime, time
-from typing import List
+import asyncio
+import random
+import threading
+import numpy as np
+from concurrent.futures import Executor
+from datetime import date, datetime, time, timedelta
+from functools import partial
+from time import perf_counter
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
 from src.models.cleaner import Cleaner
 from src.models.job import Job
-from src.models.schedule import ScheduleOptimizationResult
+from src.models.schedule import DailySchedule, ScheduleDelta, ScheduleOptimizationResult, ScheduleProgress
 from src.services.distance_service import DistanceService
+from src.services.hybrid_distance_service import RefinableTravelTimeMatrix
+from src.services.travel_time_matrix import TravelTimeMatrix
 from .job_clustering import JobClusteringService
+from .job_spatial_index import JobSpatialIndex
+from .regret_insertion import RegretInsertionBuilder
+from .route_evaluator import RouteEvaluator, RouteTiming
 from .schedule_builder import ScheduleBuilder
 from .route_optimizer import RouteOptimizer
+from .inter_route_optimizer import InterRouteOptimizer
+from .alns_optimizer import AlnsOptimizer
 from .optimization_scorer import OptimizationScorer
+from .parallel_solver import ParallelMultiStartSolver
+from .schedule_repair import ScheduleRepairer
 from src.config import config
 from ...config.config import settings
 
 
 class OptimizedAssignmentService:
+    # Share of the budget left after inter-route moves that ALNS leaves to the final 2-opt pass
+    REORDER_BUDGET_SHARE = 0.05
+
     def __init__(self, distance_service=None, config: config = None):
         self.distance_service = distance_service or DistanceService()
         self.config = config or settings
 
         # Initialize all sub-services
-        self.clustering_service = JobClusteringService()
+        self.clustering_service = JobClusteringService(self.config)
         self.schedule_builder = ScheduleBuilder(self.distance_service, self.config)
+        self.regret_builder = RegretInsertionBuilder(self.config)
         self.route_optimizer = RouteOptimizer(self.distance_service, self.config)
+        self.inter_route_optimizer = InterRouteOptimizer(self.config)
+        self.alns_optimizer = AlnsOptimizer(self.config, self.regret_builder)
+        self.parallel_solver = ParallelMultiStartSolver(self.config.PARALLEL_WORKERS)
+        self.repairer = ScheduleRepairer(self.config, self.regret_builder, self.inter_route_optimizer,
+                                         self.route_optimizer)
         self.scorer = OptimizationScorer()
+        self._last_matrix: Optional[Tuple[Optional[date], TravelTimeMatrix]] = None
 
-    def create_schedule(self, cleaners: List[Cleaner], jobs: List[Job],
-                        target_date: datetime) -> ScheduleOptimizationResult:
-        # Group jobs by area for better route clustering
-        job_clusters = self.clustering_service.cluster_jobs_by_area(
-            jobs, self.config.CLUSTERING_GRID_SIZE
-        )
+    async def create_schedule_async(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                                    time_budget_seconds: Optional[float] = None,
+                                    max_iterations: Optional[int] = None, executor: Optional[Executor] = None,
+                                    stop: Optional[threading.Event] = None) -> ScheduleOptimizationResult:
+        """Await the distance provider's network I/O, then solve from the warmed cache.
 
-        schedules = []
-        total_travel_time = 0.0
+        With an ``executor`` the CPU-bound solve runs there instead of on the event loop.
+        """
+        deadline = self._deadline(time_budget_seconds)
+        prefetch_async = getattr(self.distance_service, "prefetch_async", None)
+        if prefetch_async is None:
+            solve = partial(self._prefetch_and_solve, cleaners, jobs, target_date, deadline, max_iterations, stop)
+        else:
+            await prefetch_async(self._prefetch_points(cleaners, jobs), self._departure_buckets(cleaners, target_date))
+            solve = partial(self._solve, cleaners, jobs, target_date, deadline, max_iterations, stop)
+
+        if executor is None:
+            return solve()
+        return await asyncio.get_running_loop().run_in_executor(executor, solve)
+
+    def create_schedule(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                        time_budget_seconds: Optional[float] = None, max_iterations: Optional[int] = None,
+                        stop: Optional[threading.Event] = None) -> ScheduleOptimizationResult:
+        """Build schedules for the day.
+
+        With a time budget (counted from this call) or an iteration budget, ALNS keeps
+        improving the constructed schedules until the budget runs out. Every stage stops
+        at the time budget, so the call returns about when it runs out; jobs construction
+        has not placed by then are unassigned. Setting ``stop`` returns the best schedules
+        so far once the current stage finishes.
+        """
+        return self._prefetch_and_solve(cleaners, jobs, target_date, self._deadline(time_budget_seconds),
+                                        max_iterations, stop)
+
+    def iter_schedule(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                      time_budget_seconds: Optional[float] = None, max_iterations: Optional[int] = None,
+                      stop: Optional[threading.Event] = None) -> Iterator[ScheduleProgress]:
+        """Build schedules like create_schedule, reporting each stage as it finishes.
+
+        Updates carry only the schedules that changed: routes as construction finishes
+        them, then every improvement. The last update has stage "done" and the result.
+        Multi-start workers are not used.
+        """
+        deadline = self._deadline(time_budget_seconds)
+        self.distance_service.prefetch(self._prefetch_points(cleaners, jobs),
+                                       self._departure_buckets(cleaners, target_date))
+        return self._progress(cleaners, jobs, target_date, deadline, max_iterations, stop)
+
+    async def stream_schedule_async(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                                    time_budget_seconds: Optional[float] = None,
+                                    max_iterations: Optional[int] = None,
+                                    executor: Optional[Executor] = None) -> AsyncIterator[ScheduleProgress]:
+        """iter_schedule for the event loop: the solve runs on ``executor`` and updates arrive
+        as they happen. Closing the iterator early stops the search."""
+        deadline = self._deadline(time_budget_seconds)
+        prefetch_async = getattr(self.distance_service, "prefetch_async", None)
+        if prefetch_async is not None:
+            await prefetch_async(self._prefetch_points(cleaners, jobs), self._departure_buckets(cleaners, target_date))
+
+        loop = asyncio.get_running_loop()
+        updates: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                if prefetch_async is None:
+                    self.distance_service.prefetch(self._prefetch_points(cleaners, jobs),
+                                                   self._departure_buckets(cleaners, target_date))
+                for progress in self._progress(cleaners, jobs, target_date, deadline, max_iterations, stop):
+                    loop.call_soon_threadsafe(updates.put_nowait, progress)
+            finally:
+                loop.call_soon_threadsafe(updates.put_nowait, None)
+
+        producer = loop.run_in_executor(executor, produce)
+        try:
+            while True:
+                progress = await updates.get()
+                if progress is None:
+                    break
+                yield progress
+            await producer  # Raise what the solver raised
+        finally:
+            stop.set()
+
+    def _progress(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                  deadline: Optional[float], max_iterations: Optional[int],
+                  stop: Optional[threading.Event]) -> Iterator[ScheduleProgress]:
+        start = perf_counter()
+        travel_matrix = self._travel_matrix(cleaners, jobs, target_date)
+        sent = {}
+        for stage, schedules, unassigned in self._solve_stages(cleaners, jobs, target_date, travel_matrix, deadline,
+                                                               max_iterations, 0, stop, report_search=True):
+            done = stage == "optimized"
+            changed = [s for s in schedules if sent.get(s.cleaner_id) is not s]
+            if not changed and not done:
+                continue
+            sent.update((s.cleaner_id, s) for s in changed)
+            unassigned_jobs = [j.id for j in unassigned]
+            yield ScheduleProgress(
+                stage="done" if done else stage,
+                schedules=changed,
+                unassigned_jobs=unassigned_jobs,
+                optimization_score=self.scorer.calculate_optimization_score(schedules, unassigned_jobs),
+                elapsed_seconds=perf_counter() - start,
+                result=self._result(schedules, unassigned) if done else None
+            )
+
+    def _prefetch_and_solve(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                            deadline: Optional[float], max_iterations: Optional[int],
+                            stop: Optional[threading.Event]) -> ScheduleOptimizationResult:
+        # Fetch all travel times up front in bulk (one matrix per time bucket when profiles are on)
+        self.distance_service.prefetch(self._prefetch_points(cleaners, jobs),
+                                       self._departure_buckets(cleaners, target_date))
+        return self._solve(cleaners, jobs, target_date, deadline, max_iterations, stop)
+
+    def _solve(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+               deadline: Optional[float] = None, max_iterations: Optional[int] = None,
+               stop: Optional[threading.Event] = None) -> ScheduleOptimizationResult:
+        travel_matrix = self._travel_matrix(cleaners, jobs, target_date)
+        if self.config.PARALLEL_WORKERS > 1 and self.parallel_solver.can_share(travel_matrix):
+            return self.parallel_solver.solve(self, cleaners, jobs, target_date, travel_matrix,
+                                              deadline, max_iterations, stop)
+        return self.solve_variant(cleaners, jobs, target_date, travel_matrix, deadline, max_iterations, stop=stop)
+
+    def solve_variant(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                      travel_matrix: Optional[TravelTimeMatrix], deadline: Optional[float] = None,
+                      max_iterations: Optional[int] = None, variant: int = 0,
+                      stop: Optional[threading.Event] = None) -> ScheduleOptimizationResult:
+        """Construct and improve schedules on a given matrix.
+
+        Variant 0 is the default pipeline. Other variants break priority ties in a
+        seeded random order and use their own regret k and ALNS seed, for multi-start.
+        """
+        for _, schedules, unassigned in self._solve_stages(cleaners, jobs, target_date, travel_matrix, deadline,
+                                                           max_iterations, variant, stop):
+            pass
+        return self._result(schedules, unassigned)
+
+    def _solve_stages(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                      travel_matrix: Optional[TravelTimeMatrix], deadline: Optional[float],
+                      max_iterations: Optional[int], variant: int, stop: Optional[threading.Event],
+                      report_search: bool = False) -> Iterator[Tuple[str, List[DailySchedule], List[Job]]]:
+        """The solver pipeline, yielding (stage, schedules, unassigned jobs) as it goes.
+
+        The last item is the final solution. With ``report_search`` every new best ALNS
+        solution is yielded too. A schedule that did not change between two items is the
+        same object in both. Each stage stops at ``deadline``, and ALNS is skipped once it
+        has passed. Once ``stop`` is set the pipeline ends after the current stage, and
+        the last item is the best solution so far.
+        """
+        points = self._schedule_points(cleaners, jobs)
 
         # Sort jobs by priority and preferred time
+        if variant:
+            jobs = list(jobs)
+            random.Random(variant).shuffle(jobs)
         sorted_jobs = sorted(jobs,
                              key=lambda j: (self.scorer.priority_weight(j.priority),
                                             j.preferred_start_time or time(12, 0)))
 
+        # Routes are timed and improved on a matrix even when the greedy builder works without one
+        if travel_matrix is not None:
+            evaluator = RouteEvaluator(self.config, travel_matrix)
+        elif self._times_on_demand():
+            evaluator = RouteEvaluator(self.config, RefinableTravelTimeMatrix(
+                points, self.distance_service.distance_matrix_km(points), self.distance_service))
+        else:
+            evaluator = RouteEvaluator(self.config, self.distance_service.build_travel_time_matrix(points))
+
+        # Lazily refined matrices (hybrid provider or on-demand times) serve the greedy builder's
+        # nearest-job searches; regret insertion and ALNS would ask for road times one leg at a time
+        lazy = evaluator.travel_matrix.is_estimated
+        construction_method = "sequential" if lazy else self.config.CONSTRUCTION_METHOD
+
         # Create initial assignments
-        for cleaner in cleaners:
-            daily_schedule = self.schedule_builder.create_optimized_schedule(
-                cleaner, sorted_jobs.copy(), target_date, job_clusters
-            )
-            schedules.append(daily_schedule)
-            total_travel_time += daily_schedule.total_travel_hours
+        if construction_method == "regret":
+            schedules, unassigned = self.regret_builder.build(cleaners, sorted_jobs, target_date, evaluator,
+                                                              self.config.REGRET_K + variant % 2, deadline)
+            yield "constructed", schedules, unassigned
+        elif construction_method == "sequential":
+            # One item per finished cleaner; the last one has every cleaner's route
+            for schedules, unassigned in self._iter_sequential(cleaners, sorted_jobs, target_date, travel_matrix,
+                                                               evaluator, deadline):
+                yield "route", schedules, unassigned
+        else:
+            raise ValueError(f"Unknown construction method: {self.config.CONSTRUCTION_METHOD}")
 
-            # Remove assigned jobs
-            assigned_job_ids = [a.job_id for a in daily_schedule.assignments]
-            sorted_jobs = [j for j in sorted_jobs if j.id not in assigned_job_ids]
+        if self._stopped(stop):
+            return
 
-        # Try to reassign unassigned jobs using 2-opt improvement
-        optimized_schedules = self.route_optimizer.improve_schedules_2opt(schedules, target_date)
+        # Move jobs between cleaners and fit in the unassigned ones
+        schedules, unassigned = self.inter_route_optimizer.improve(schedules, unassigned, cleaners, jobs,
+                                                                   target_date, evaluator, deadline=deadline)
+        yield "improved", schedules, unassigned
+        if self._stopped(stop):
+            return
 
-        # Final unassigned jobs
-        unassigned_jobs = [j.id for j in sorted_jobs]
+        # Spend whatever budget is left on large-neighbourhood search, less the share kept for 2-opt
+        search = (deadline is not None or max_iterations is not None) and not lazy and not self._expired(deadline)
+        search_deadline = (None if deadline is None
+                           else deadline - self.REORDER_BUDGET_SHARE * max(0.0, deadline - perf_counter()))
+        if search and report_search:
+            for schedules, unassigned in self.alns_optimizer.optimize_steps(
+                    schedules, cleaners, sorted_jobs, target_date, evaluator, search_deadline, max_iterations,
+                    seed=variant, stop=stop):
+                yield "improved", schedules, unassigned
+        elif search:
+            schedules, unassigned = self.alns_optimizer.optimize(schedules, cleaners, sorted_jobs, target_date,
+                                                                 evaluator, search_deadline, max_iterations,
+                                                                 seed=variant, stop=stop)
+            yield "improved", schedules, unassigned
 
-        # Calculate optimization score
-        optimization_score = self.scorer.calculate_optimization_score(
-            optimized_schedules, unassigned_jobs
-        )
+        if self._stopped(stop):
+            return
+
+        # Reorder each cleaner's jobs to cut travel
+        optimized_schedules = self.route_optimizer.improve_schedules_2opt(schedules, target_date,
+                                                                          cleaners, jobs, evaluator, deadline)
+        yield "optimized", optimized_schedules, unassigned
+
+    async def repair_schedule_async(self, result: ScheduleOptimizationResult, delta: ScheduleDelta,
+                                    cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                                    executor: Optional[Executor] = None) -> ScheduleOptimizationResult:
+        """Await travel times for any new locations, then repair from the warmed cache"""
+        cleaners, jobs = delta.apply(cleaners, jobs)
+        prefetch_async = getattr(self.distance_service, "prefetch_async", None)
+        if prefetch_async is None:
+            repair = partial(self._prefetch_and_repair, result, delta, cleaners, jobs, target_date)
+        else:
+            await prefetch_async(self._schedule_points(cleaners, jobs), self._departure_buckets(cleaners, target_date))
+            repair = partial(self._repair, result, delta, cleaners, jobs, target_date)
 
+        if executor is None:
+            return repair()
+        return await asyncio.get_running_loop().run_in_executor(executor, repair)
+
+    def repair_schedule(self, result: ScheduleOptimizationResult, delta: ScheduleDelta,
+                        cleaners: List[Cleaner], jobs: List[Job],
+                        target_date: datetime) -> ScheduleOptimizationResult:
+        """Update a schedule for added, changed or removed jobs and cleaners.
+
+        ``cleaners`` and ``jobs`` are the lists ``result`` was built from. Only the routes
+        the delta touches are re-planned, so this is much faster than a new solve.
+        """
+        cleaners, jobs = delta.apply(cleaners, jobs)
+        return self._prefetch_and_repair(result, delta, cleaners, jobs, target_date)
+
+    def _prefetch_and_repair(self, result: ScheduleOptimizationResult, delta: ScheduleDelta,
+                             cleaners: List[Cleaner], jobs: List[Job],
+                             target_date: datetime) -> ScheduleOptimizationResult:
+        self.distance_service.prefetch(self._schedule_points(cleaners, jobs),
+                                       self._departure_buckets(cleaners, target_date))
+        return self._repair(result, delta, cleaners, jobs, target_date)
+
+    def _repair(self, result: ScheduleOptimizationResult, delta: ScheduleDelta, cleaners: List[Cleaner],
+                jobs: List[Job], target_date: datetime) -> ScheduleOptimizationResult:
+        travel_matrix = self._travel_matrix(cleaners, jobs, target_date, reuse=True)
+        evaluator = RouteEvaluator(self.config, travel_matrix if travel_matrix is not None else
+                                   self.distance_service.build_travel_time_matrix(self._schedule_points(cleaners, jobs)))
+        schedules, unassigned = self.repairer.repair(result, delta, cleaners, jobs, target_date, evaluator)
+        return self._result(schedules, unassigned)
+
+    def start(self) -> None:
+        """Spawn the multi-start worker processes, so the first solve does not wait for them"""
+        if self.config.PARALLEL_WORKERS > 1:
+            self.parallel_solver.start()
+
+    def close(self) -> None:
+        """Stop the multi-start worker processes"""
+        self.parallel_solver.close()
+
+    def _iter_sequential(self, cleaners: List[Cleaner], sorted_jobs: List[Job], target_date: datetime,
+                         travel_matrix: Optional[TravelTimeMatrix], evaluator: RouteEvaluator,
+                         deadline: Optional[float] = None) -> Iterator[Tuple[List[DailySchedule], List[Job]]]:
+        """Fill cleaners one at a time with the greedy ScheduleBuilder, yielding the schedules
+        built so far and the jobs still unassigned after each cleaner. Cleaners not reached
+        by ``deadline`` get an empty day."""
+        schedules = []
+        problem = evaluator.compile(cleaners, sorted_jobs)
+        remaining = np.ones(len(sorted_jobs), dtype=bool)
+
+        # Group jobs by area for better route clustering; the builders drop assigned
+        # jobs from it, so each cluster lists the remaining jobs in priority order
+        job_clusters = self.clustering_service.cluster_jobs(sorted_jobs, cleaners, target_date)
+        # Nearest-neighbour searches walk a KD-tree over the remaining jobs, unless they never can
+        use_index = (self.config.USE_SPATIAL_INDEX
+                     and self.schedule_builder.job_finder.can_use_index(travel_matrix, len(sorted_jobs)))
+        spatial_index = JobSpatialIndex(problem.coordinates) if use_index else None
+
+        for r, cleaner in enumerate(cleaners):
+            if self._expired(deadline):
+                route, timing = [], RouteTiming([], [], [], 0.0, 0.0)
+            else:
+                route, timing = self.schedule_builder.build_route(problem, r, remaining, job_clusters,
+                                                                  travel_matrix, spatial_index)
+            schedules.append(evaluator.to_schedule(cleaner, [sorted_jobs[k] for k in route], timing, target_date))
+            yield list(schedules), [sorted_jobs[k] for k in np.flatnonzero(remaining).tolist()]
+
+        if not cleaners:
+            yield [], sorted_jobs
+
+    def _result(self, schedules: List[DailySchedule], unassigned: List[Job]) -> ScheduleOptimizationResult:
+        unassigned_jobs = [j.id for j in unassigned]
         return ScheduleOptimizationResult(
-            schedules=optimized_schedules,
+            schedules=schedules,
             unassigned_jobs=unassigned_jobs,
-            total_travel_time=sum(s.total_travel_hours for s in optimized_schedules),
-            optimization_score=optimization_score,
+            total_travel_time=sum(s.total_travel_hours for s in schedules),
+            optimization_score=self.scorer.calculate_optimization_score(schedules, unassigned_jobs),
             created_at=datetime.now()
-        )
\ No newline at end of file
+        )
+
+    def _travel_matrix(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                       reuse: bool = False) -> Optional[TravelTimeMatrix]:
+        """Matrix over the prefetched travel times, or None when the builder should not use one.
+
+        The last matrix built is kept; with ``reuse`` it is returned again when it is for
+        the same day and already covers every point, which saves rebuilding it on repairs.
+        """
+        if not self.config.USE_TRAVEL_TIME_MATRIX:
+            return None
+        points = self._schedule_points(cleaners, jobs)
+        departure_buckets = self._departure_buckets(cleaners, target_date)
+        day = target_date.date() if departure_buckets else None
+        if reuse and self._last_matrix is not None:
+            last_day, matrix = self._last_matrix
+            if last_day == day and all(p in matrix for p in points):
+                return matrix
+
+        if departure_buckets:
+            matrix = self.distance_service.build_travel_time_profile(points, target_date, departure_buckets)
+        else:
+            matrix = self.distance_service.build_travel_time_matrix(points)
+        self._last_matrix = (day, matrix)
+        return matrix
+
+    @staticmethod
+    def _stopped(stop: Optional[threading.Event]) -> bool:
+        return stop is not None and stop.is_set()
+
+    @staticmethod
+    def _expired(deadline: Optional[float]) -> bool:
+        return deadline is not None and perf_counter() >= deadline
+
+    def _deadline(self, time_budget_seconds: Optional[float]) -> Optional[float]:
+        return None if time_budget_seconds is None else perf_counter() + time_budget_seconds
+
+    def _departure_buckets(self, cleaners: List[Cleaner], target_date: datetime) -> List[datetime]:
+        """Start of every time-profile bucket between the earliest start and latest end of the day"""
+        if not self.config.USE_TIME_PROFILES or not self.config.USE_TRAVEL_TIME_MATRIX or not cleaners:
+            return []
+
+        bucket_minutes = self.config.TRAVEL_TIME_BUCKET_MINUTES
+        start = min(c.working_hours.start_time for c in cleaners)
+        start_minutes = start.hour * 60 + start.minute
+        start_minutes -= start_minutes % bucket_minutes
+
+        departure = datetime.combine(target_date.date(), time(0, 0)) + timedelta(minutes=start_minutes)
+        last = datetime.combine(target_date.date(), max(c.working_hours.end_time for c in cleaners))
+        departures = []
+        while departure < last:
+            departures.append(departure)
+            departure += timedelta(minutes=bucket_minutes)
+        return departures
+
+    def _times_on_demand(self) -> bool:
+        """Whether a remote provider is asked only for the travel times the solve uses.
+
+        That is the case when the greedy builder works without a matrix and walks the
+        spatial index: nothing is prefetched, and routes are timed on geodesic estimates
+        that are replaced with the provider's times leg by leg.
+        """
+        return (not self.config.USE_TRAVEL_TIME_MATRIX and self.config.USE_SPATIAL_INDEX
+                and self.config.CONSTRUCTION_METHOD == "sequential"
+                and getattr(self.distance_service, "get_matrix", None) is not None)
+
+    def _prefetch_points(self, cleaners: List[Cleaner], jobs: List[Job]) -> List[Tuple[float, float]]:
+        """Points whose travel times a solve fetches up front (none when they are fetched on demand)"""
+        return [] if self._times_on_demand() else self._schedule_points(cleaners, jobs)
+
+    def _schedule_points(self, cleaners: List[Cleaner], jobs: List[Job]) -> List[Tuple[float, float]]:
+        """All cleaner homes and job locations, deduplicated"""
+        points = [c.home_coordinates for c in cleaners] + [j.coordinates for j in jobs]
+        return TravelTimeMatrix.unique_points(points)
@@ -0,0 +1,296 @@
+import numpy as np
+from datetime import datetime
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from src.models.cleaner import Cleaner
+from src.models.job import Job
+from src.models.schedule import DailySchedule
+from .constraint_checker import ConstraintChecker
+from .optimization_scorer import OptimizationScorer
+from .route_evaluator import RouteEvaluator, RouteSlack, RouteTiming
+
+
+class InterRouteOptimizer:
+    """Moves jobs between cleaners and into the schedule to lower the optimization score.
+
+    Each pass first tries to insert every unassigned job next to one of its nearest
+    assigned jobs (or into an idle cleaner's empty day). Then, for every assigned job
+    and each of its nearest neighbours on another route, it tries relocate (move the job
+    next to the neighbour), exchange (swap the two jobs) and cross-exchange (swap
+    segments of up to MAX_SEGMENT_LENGTH jobs). Candidate moves are screened with
+    constant-time travel and balance deltas. The touched routes are re-timed with
+    RouteEvaluator before a move is accepted, unless the receiving route's RouteSlack
+    already rules the insertion out.
+    """
+
+    NEIGHBOURS = 10
+    MAX_PASSES = 10
+    MAX_SEGMENT_LENGTH = 2
+    EPSILON = 1e-9
+
+    def __init__(self, config, constraint_checker: Optional[ConstraintChecker] = None):
+        self.config = config
+        self.constraint_checker = constraint_checker or ConstraintChecker()
+        self.scorer = OptimizationScorer()
+
+    def improve(self, schedules: List[DailySchedule], unassigned_jobs: List[Job],
+                cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                evaluator: RouteEvaluator, focus: Optional[Set[int]] = None,
+                deadline: Optional[float] = None) -> Tuple[List[DailySchedule], List[Job]]:
+        """Improved schedules and the jobs still unassigned (in their original order).
+
+        With ``focus``, unassigned jobs are only inserted into, and moves between routes
+        only start from, those routes (by index into ``schedules``) and routes a move has
+        changed since. The search stops at ``deadline`` (a time.perf_counter() value),
+        checked before each job it starts from.
+        """
+        state = RouteSet(schedules, unassigned_jobs, cleaners, jobs, evaluator, self.constraint_checker)
+        neighbours = self.neighbour_lists(jobs, evaluator)
+
+        for _ in range(self.MAX_PASSES):
+            if self._expired(deadline):
+                break
+            improved = self._insert_unassigned(state, neighbours, focus, deadline)
+            improved = self._exchange_between_routes(state, neighbours, focus, deadline) or improved
+            if not improved:
+                break
+
+        return state.to_schedules(schedules, target_date), [j for j in unassigned_jobs if j.id in state.unassigned]
+
+    def neighbour_lists(self, jobs: List[Job], evaluator: RouteEvaluator) -> Dict[str, List[Job]]:
+        """The NEIGHBOURS closest jobs to each job, nearest first (travel both ways)"""
+        if len(jobs) < 2:
+            return {j.id: [] for j in jobs}
+        points = np.asarray([evaluator.point_of(j) for j in jobs], dtype=np.int64)
+        hours = evaluator.travel_matrix.hours[points][:, points]
+        hours = hours + hours.T
+        np.fill_diagonal(hours, np.inf)
+        k = min(self.NEIGHBOURS, len(jobs) - 1)
+        nearest = np.argpartition(hours, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(hours, nearest, axis=1), axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        return {job.id: [jobs[m] for m in row] for job, row in zip(jobs, nearest.tolist())}
+
+    def _insert_unassigned(self, state: "RouteSet", neighbours: Dict[str, List[Job]],
+                           focus: Optional[Set[int]] = None, deadline: Optional[float] = None) -> bool:
+        improved = False
+        idle = state.idle_routes()
+        for job in [j for j in state.jobs if j.id in state.unassigned]:
+            if self._expired(deadline):
+                break
+            candidates = []
+            for neighbour in neighbours[job.id]:
+                r = state.route_of.get(neighbour.id)
+                if r is None or not state.eligible(job, r) or not self._in_focus(state, r, focus):
+                    continue
+                j = state.position(r, neighbour)
+                for at in (j, j + 1):
+                    candidates.append((state.splice_delta(r, at, at, [job]), r, at))
+            for r in idle:
+                if state.eligible(job, r) and self._in_focus(state, r, focus):
+                    candidates.append((0.0, r, 0))
+
+            candidates = [(travel, r, at) for travel, r, at in sorted(candidates, key=lambda c: c[0])
+                          if travel + state.balance_delta({r: job.estimated_duration_hours})
+                          - self.scorer.UNASSIGNED_PENALTY < -self.EPSILON]
+            state.refine_insertions(job, [(r, at) for _, r, at in candidates])
+            for travel, r, at in candidates:
+                if not state.may_insert(r, job, at):
+                    continue
+                if state.try_apply({r: state.routes[r][:at] + [job] + state.routes[r][at:]},
+                                   -self.scorer.UNASSIGNED_PENALTY, self.EPSILON):
+                    state.unassigned.discard(job.id)
+                    state.route_of[job.id] = r
+                    idle = state.idle_routes()
+                    improved = True
+                    break
+        return improved
+
+    def _exchange_between_routes(self, state: "RouteSet", neighbours: Dict[str, List[Job]],
+                                 focus: Optional[Set[int]] = None, deadline: Optional[float] = None) -> bool:
+        improved = False
+        for job in state.jobs:
+            if self._expired(deadline):
+                break
+            a = state.route_of.get(job.id)
+            if a is None or not self._in_focus(state, a, focus):
+                continue
+            for neighbour in neighbours[job.id]:
+                b = state.route_of.get(neighbour.id)
+                if b is None or b == a:
+                    continue
+                if self._try_pair_moves(state, job, a, neighbour, b):
+                    improved = True
+                    break
+        return improved
+
+    @staticmethod
+    def _expired(deadline: Optional[float]) -> bool:
+        return deadline is not None and perf_counter() >= deadline
+
+    @staticmethod
+    def _in_focus(state: "RouteSet", r: int, focus: Optional[Set[int]]) -> bool:
+        return focus is None or r in focus or r in state.changed
+
+    def _try_pair_moves(self, state: "RouteSet", job: Job, a: int, neighbour: Job, b: int) -> bool:
+        route_a, route_b = state.routes[a], state.routes[b]
+        i, j = state.position(a, job), state.position(b, neighbour)
+
+        # Relocate the job next to its neighbour
+        if state.eligible(job, b):
+            removal = state.splice_delta(a, i, i + 1, [])
+            for at in (j, j + 1):
+                delta = (removal + state.splice_delta(b, at, at, [job])
+                         + state.balance_delta({a: -job.estimated_duration_hours, b: job.estimated_duration_hours}))
+                if delta < -self.EPSILON and state.may_insert(b, job, at) and state.try_apply(
+                        {a: route_a[:i] + route_a[i + 1:], b: route_b[:at] + [job] + route_b[at:]}, 0.0, self.EPSILON):
+                    state.route_of[job.id] = b
+                    return True
+
+        # Exchange (1-1) and cross-exchange segments starting at the job and its neighbour
+        for length_a in range(1, min(self.MAX_SEGMENT_LENGTH, len(route_a) - i) + 1):
+            segment_a = route_a[i:i + length_a]
+            if not all(state.eligible(x, b) for x in segment_a):
+                break
+            for length_b in range(1, min(self.MAX_SEGMENT_LENGTH, len(route_b) - j) + 1):
+                segment_b = route_b[j:j + length_b]
+                if not all(state.eligible(x, a) for x in segment_b):
+                    break
+                moved = (sum(x.estimated_duration_hours for x in segment_b)
+                         - sum(x.estimated_duration_hours for x in segment_a))
+                delta = (state.splice_delta(a, i, i + length_a, segment_b)
+                         + state.splice_delta(b, j, j + length_b, segment_a)
+                         + state.balance_delta({a: moved, b: -moved}))
+                if delta < -self.EPSILON and state.try_apply(
+                        {a: route_a[:i] + segment_b + route_a[i + length_a:],
+                         b: route_b[:j] + segment_a + route_b[j + length_b:]}, 0.0, self.EPSILON):
+                    for x in segment_a:
+                        state.route_of[x.id] = b
+                    for x in segment_b:
+                        state.route_of[x.id] = a
+                    return True
+        return False
+
+
+class RouteSet:
+    """Every cleaner's route with its timing, the unassigned jobs and the score terms"""
+
+    def __init__(self, schedules: List[DailySchedule], unassigned_jobs: List[Job], cleaners: List[Cleaner],
+                 jobs: List[Job], evaluator: RouteEvaluator, constraint_checker: ConstraintChecker):
+        self.evaluator = evaluator
+        self.constraint_checker = constraint_checker
+        self.jobs = jobs
+        self.hours = evaluator.travel_matrix.hours
+        cleaners_by_id = {c.id: c for c in cleaners}
+        jobs_by_id = {j.id: j for j in jobs}
+
+        self.cleaners = [cleaners_by_id[s.cleaner_id] for s in schedules]
+        self.routes: List[List[Job]] = [[jobs_by_id[a.job_id] for a in s.assignments] for s in schedules]
+        self.timings: List[Optional[RouteTiming]] = [evaluator.simulate(c, route)
+                                                     for c, route in zip(self.cleaners, self.routes)]
+        self.changed = set()
+        self.unassigned = {j.id for j in unassigned_jobs}
+        # Routes the evaluator cannot reproduce are left exactly as they were built
+        self.route_of: Dict[str, int] = {job.id: r for r, route in enumerate(self.routes)
+                                         if self.timings[r] is not None for job in route}
+        self.problem = evaluator.compile(self.cleaners, jobs)
+        self._position = self.problem.position
+        # Who may take what: the skills, and never a route that is left as built
+        self._eligible = self.problem.eligible & np.asarray([t is not None for t in self.timings], dtype=bool)
+        self._slack: Dict[int, Optional[RouteSlack]] = {}
+
+        self.work = [t.total_work_hours if t else s.total_work_hours for t, s in zip(self.timings, schedules)]
+        self.work_sum = sum(self.work)
+        self.work_sq_sum = sum(h * h for h in self.work)
+
+    def eligible(self, job: Job, r: int) -> bool:
+        return bool(self._eligible[self._position[job.id], r])
+
+    def may_insert(self, r: int, job: Job, at: int) -> bool:
+        """False when inserting ``job`` into route r before position ``at`` certainly fails"""
+        if r not in self._slack:
+            problem = self.problem
+            route = [self._position[x.id] for x in self.routes[r]]
+            self._slack[r] = self.evaluator.slack(problem.point[route].tolist(), problem.latest[route].tolist(),
+                                                  float(problem.start[r]), float(problem.day_end[r]),
+                                                  float(problem.max_hours[r]), self.timings[r])
+        slack = self._slack[r]
+        k = self._position[job.id]
+        return slack is None or slack.may_insert(int(self.problem.point[k]), float(self.problem.duration[k]),
+                                                 float(self.problem.latest[k]), at)
+
+    def refine_insertions(self, job: Job, positions: Sequence[Tuple[int, int]]) -> None:
+        """Have an estimated matrix fetch the legs to and from ``job`` for insertions at (route, position).
+
+        One batch each way, so a job's candidate insertions cost two requests.
+        """
+        point = self.evaluator.point_of(job)
+        before = [self.evaluator.point_of(self.routes[r][at - 1]) for r, at in positions if at > 0]
+        after = [self.evaluator.point_of(self.routes[r][at]) for r, at in positions if at < len(self.routes[r])]
+        self.evaluator.refine_legs(before, [point] * len(before))
+        self.evaluator.refine_legs([point] * len(after), after)
+
+    def position(self, r: int, job: Job) -> int:
+        return next(k for k, x in enumerate(self.routes[r]) if x.id == job.id)
+
+    def idle_routes(self) -> List[int]:
+        return [r for r, route in enumerate(self.routes) if not route and self.timings[r] is not None]
+
+    def splice_delta(self, r: int, start: int, end: int, inserted: Sequence[Job]) -> float:
+        """Travel change from replacing routes[r][start:end] with ``inserted`` (matrix estimate)"""
+        route = self.routes[r]
+        before = self.evaluator.point_of(route[start - 1]) if start > 0 else None
+        after = self.evaluator.point_of(route[end]) if end < len(route) else None
+        old = [before] + [self.evaluator.point_of(x) for x in route[start:end]] + [after]
+        new = [before] + [self.evaluator.point_of(x) for x in inserted] + [after]
+        return self._path_hours(new) - self._path_hours(old)
+
+    def balance_delta(self, work_change: Dict[int, float]) -> float:
+        """Change of the workload-balance term of the score"""
+        total, squares = self.work_sum, self.work_sq_sum
+        for r, change in work_change.items():
+            total += change
+            squares += (self.work[r] + change) ** 2 - self.work[r] ** 2
+        return OptimizationScorer.BALANCE_WEIGHT * (self._spread(total, squares) - self._spread(self.work_sum, self.work_sq_sum))
+
+    def try_apply(self, new_routes: Dict[int, List[Job]], fixed_delta: float, epsilon: float) -> bool:
+        """Re-time the changed routes and keep them if feasible and the score drops"""
+        # Every new leg of every changed route in one batch for estimated matrices
+        legs = [(self.evaluator.point_of(a), self.evaluator.point_of(b))
+                for route in new_routes.values() for a, b in zip(route, route[1:])]
+        self.evaluator.refine_legs([a for a, _ in legs], [b for _, b in legs])
+
+        timings = {}
+        for r, route in new_routes.items():
+            timing = self.evaluator.simulate(self.cleaners[r], route)
+            if timing is None:
+                return False
+            timings[r] = timing
+
+        travel = sum(t.total_travel_hours - self.timings[r].total_travel_hours for r, t in timings.items())
+        delta = travel + fixed_delta + self.balance_delta(
+            {r: t.total_work_hours - self.work[r] for r, t in timings.items()})
+        if delta >= -epsilon:
+            return False
+
+        for r, timing in timings.items():
+            self.work_sum += timing.total_work_hours - self.work[r]
+            self.work_sq_sum += timing.total_work_hours ** 2 - self.work[r] ** 2
+            self.work[r] = timing.total_work_hours
+            self.routes[r] = new_routes[r]
+            self.timings[r] = timing
+            self._slack.pop(r, None)
+            self.changed.add(r)
+        return True
+
+    def to_schedules(self, schedules: List[DailySchedule], target_date: datetime) -> List[DailySchedule]:
+        return [self.evaluator.to_schedule(self.cleaners[r], self.routes[r], self.timings[r], target_date)
+                if r in self.changed else schedule for r, schedule in enumerate(schedules)]
+
+    def _spread(self, total: float, squares: float) -> float:
+        count = len(self.work)
+        return squares - total * total / count if count else 0.0
+
+    def _path_hours(self, points: List[Optional[int]]) -> float:
+        # Legs from or to None (before the first job / after the last) are not counted
+        return sum(float(self.hours[p, q]) for p, q in zip(points, points[1:]) if p is not None and q is not None)
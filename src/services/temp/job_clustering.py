@@ -1,11 +1,167 @@
-from typing import List, Dict, Tuple, Optional
+import copy
+import hashlib
+import math
+import threading
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+from typing import Hashable, List, Dict, Tuple, Optional, Iterator
+from src.models.cleaner import Cleaner
 from src.models.job import Job
+from ...config.config import settings
+
+
+class JobClusterIndex:
+    """Grid clustering result used as a lookup index.
+
+    Maps coordinates to grid cells arithmetically, job ids to cells, and cells to the
+    jobs in them that are still unassigned. Behaves as a read-only mapping of
+    cell -> live jobs for code that iterates clusters.
+    """
+
+    def __init__(self, min_lat: float, min_lng: float, lat_step: float, lng_step: float,
+                 grid_size: int, bounds: Tuple[float, float, float, float]):
+        self.min_lat = min_lat
+        self.min_lng = min_lng
+        self.lat_step = lat_step
+        self.lng_step = lng_step
+        self.grid_size = grid_size
+        self.bounds = bounds
+        self.cell_of_job: Dict[str, Hashable] = {}
+        self._live: Dict[Hashable, Dict[str, Job]] = {}
+
+    def cell_of(self, location: Tuple[float, float]) -> Optional[Tuple[int, int]]:
+        """Grid cell of a coordinate, or None when it lies outside the clustered area"""
+        min_lat, max_lat, min_lng, max_lng = self.bounds
+        if not (min_lat <= location[0] <= max_lat and min_lng <= location[1] <= max_lng):
+            return None
+        lat_idx = int((location[0] - self.min_lat) / self.lat_step) if self.lat_step > 0 else 0
+        lng_idx = int((location[1] - self.min_lng) / self.lng_step) if self.lng_step > 0 else 0
+        # Ensure indices are within bounds
+        return min(lat_idx, self.grid_size - 1), min(lng_idx, self.grid_size - 1)
+
+    def add(self, job: Job, cell: Optional[Hashable] = None) -> None:
+        if cell is None:
+            cell = self.cell_of(job.coordinates)
+        self.cell_of_job[job.id] = cell
+        self._live.setdefault(cell, {})[job.id] = job
+
+    def remove(self, job: Job) -> None:
+        """Drop an assigned job from its cell"""
+        cell = self.cell_of_job.get(job.id)
+        if cell is not None:
+            self._live.get(cell, {}).pop(job.id, None)
+
+    def live_jobs(self, cell: Optional[Hashable]) -> List[Job]:
+        """Unassigned jobs in a cell"""
+        if cell is None:
+            return []
+        return list(self._live.get(cell, {}).values())
+
+    def live_ids(self, cell: Optional[Hashable]) -> List[str]:
+        """Ids of the unassigned jobs in a cell, without touching the job models"""
+        if cell is None:
+            return []
+        return list(self._live.get(cell, {}))
+
+    def copy(self) -> "JobClusterIndex":
+        """Independent copy whose live sets can be consumed by one solve"""
+        clone = copy.copy(self)
+        clone.cell_of_job = dict(self.cell_of_job)
+        clone._live = {cell: dict(jobs) for cell, jobs in self._live.items()}
+        return clone
+
+    def __getitem__(self, cell: Hashable) -> List[Job]:
+        return self.live_jobs(cell)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._live)
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def keys(self):
+        return self._live.keys()
+
+    def items(self):
+        return [(cell, self.live_jobs(cell)) for cell in self._live]
+
+
+class CentroidClusterIndex(JobClusterIndex):
+    """Cluster index for centroid-based clusters with integer cluster ids.
+
+    Job coordinates resolve to the cluster their job was assigned to (which, with
+    balancing, is not always the nearest centroid); other coordinates resolve to the
+    nearest centroid.
+    """
+
+    def __init__(self, centroids: np.ndarray, km_scale: Tuple[float, float]):
+        super().__init__(0.0, 0.0, 0.0, 0.0, len(centroids), (0.0, -1.0, 0.0, -1.0))
+        self.centroids = centroids
+        self.km_scale = km_scale
+        self._cluster_of_point: Dict[Tuple[float, float], int] = {}
+
+    def add(self, job: Job, cell: Optional[Hashable] = None) -> None:
+        super().add(job, cell)
+        self._cluster_of_point.setdefault(tuple(job.coordinates), self.cell_of_job[job.id])
+
+    def cell_of(self, location: Tuple[float, float]) -> Optional[int]:
+        cluster = self._cluster_of_point.get(tuple(location))
+        if cluster is not None or not len(self.centroids):
+            return cluster
+        xy = np.asarray(location, dtype=float) * self.km_scale
+        return int(np.argmin(((self.centroids - xy) ** 2).sum(axis=1)))
+
 
 class JobClusteringService:
-    def cluster_jobs_by_area(self, jobs: List[Job], grid_size: int = 5) -> Dict[Tuple[int, int], List[Job]]:
+    """Groups the day's jobs into areas for the cluster-first job search.
+
+    ``CLUSTERING_METHOD`` selects the fixed grid (``"grid"``) or k-means balanced by
+    job hours against cleaner capacity (``"balanced_kmeans"``). Results are cached per
+    day and job set; callers get a copy they may consume.
+    """
+
+    KM_PER_DEGREE = 111.19
+    MAX_ITERATIONS = 25
+    CACHE_SIZE = 16
+
+    def __init__(self, config=None):
+        self.config = config or settings
+        self._cache: "OrderedDict[Tuple, JobClusterIndex]" = OrderedDict()
+        self._lock = threading.Lock()  # Solves may run concurrently in worker threads
+
+    def cluster_jobs(self, jobs: List[Job], cleaners: List[Cleaner],
+                     target_date: datetime) -> JobClusterIndex:
+        """Cluster jobs with the configured method, reusing the result for the same day and inputs"""
+        method = self.config.CLUSTERING_METHOD
+        if method == "grid":
+            parameters = (self.config.CLUSTERING_GRID_SIZE,)
+        elif method == "balanced_kmeans":
+            parameters = (self.cleaner_capacity_hours(cleaners), self.config.CLUSTER_CAPACITY_SLACK)
+        else:
+            raise ValueError(f"Unknown clustering method: {method}")
+
+        key = (target_date.date(), method, parameters, self._jobs_fingerprint(jobs))
+        with self._lock:
+            clusters = self._cache.get(key)
+            if clusters is not None:
+                self._cache.move_to_end(key)
+                return clusters.copy()
+
+        if method == "grid":
+            clusters = self.cluster_jobs_by_area(jobs, *parameters)
+        else:
+            clusters = self.cluster_jobs_balanced(jobs, *parameters)
+        with self._lock:
+            self._cache[key] = clusters
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return clusters.copy()
+
+    def cluster_jobs_by_area(self, jobs: List[Job], grid_size: int = 5) -> JobClusterIndex:
         """Simple grid-based clustering of jobs by geographic area"""
         if not jobs:
-            return {}
+            return JobClusterIndex(0.0, 0.0, 0.0, 0.0, grid_size, (0.0, -1.0, 0.0, -1.0))
 
         # Find bounds
         lats = [j.coordinates[0] for j in jobs]
@@ -17,25 +173,108 @@ class JobClusteringService:
         lat_step = (max_lat - min_lat) / grid_size
         lng_step = (max_lng - min_lng) / grid_size
 
-        clusters = {}
+        clusters = JobClusterIndex(min_lat, min_lng, lat_step, lng_step, grid_size,
+                                   (min_lat, max_lat, min_lng, max_lng))
         for job in jobs:
-            lat_idx = int((job.coordinates[0] - min_lat) / lat_step) if lat_step > 0 else 0
-            lng_idx = int((job.coordinates[1] - min_lng) / lng_step) if lng_step > 0 else 0
-            # Ensure indices are within bounds
-            lat_idx = min(lat_idx, grid_size - 1)
-            lng_idx = min(lng_idx, grid_size - 1)
-
-            key = (lat_idx, lng_idx)
-            if key not in clusters:
-                clusters[key] = []
-            clusters[key].append(job)
+            clusters.add(job)
 
         return clusters
 
-    def find_job_cluster(self, location: Tuple[float, float], job_clusters: Dict) -> Optional[Tuple[int, int]]:
+    def find_job_cluster(self, location: Tuple[float, float], job_clusters: JobClusterIndex) -> Optional[Tuple[int, int]]:
         """Find which cluster a location belongs to"""
-        for cluster_key, jobs in job_clusters.items():
-            for job in jobs:
-                if job.coordinates == location:
-                    return cluster_key
-        return None
\ No newline at end of file
+        return job_clusters.cell_of(location)
+
+    def cluster_jobs_balanced(self, jobs: List[Job], capacity_hours: float,
+                              slack: float = 0.2) -> CentroidClusterIndex:
+        """K-means over job locations with a cap on the job hours per cluster.
+
+        One cluster per ``capacity_hours`` of work (roughly one cleaner-day), each
+        holding at most ``(1 + slack)`` times the average cluster load. Jobs are
+        assigned greedily to their nearest cluster with room, the jobs with the most to
+        lose from a second choice first.
+        """
+        if not jobs:
+            return CentroidClusterIndex(np.zeros((0, 2)), (1.0, 1.0))
+
+        coords = np.asarray([j.coordinates for j in jobs], dtype=float)
+        hours = np.asarray([j.estimated_duration_hours for j in jobs], dtype=float)
+        km_scale = (self.KM_PER_DEGREE, self.KM_PER_DEGREE * math.cos(math.radians(coords[:, 0].mean())))
+        xy = coords * km_scale
+
+        k = min(len(jobs), max(1, math.ceil(hours.sum() / max(capacity_hours, 1e-9))))
+        cluster_cap = hours.sum() / k * (1 + slack)
+        centroids = self._kmeans_plus_plus(xy, k, np.random.default_rng(0))
+
+        labels = None
+        for _ in range(self.MAX_ITERATIONS):
+            new_labels = self._assign_with_capacity(xy, hours, centroids, cluster_cap)
+            if labels is not None and np.array_equal(labels, new_labels):
+                break
+            labels = new_labels
+            counts = np.bincount(labels, minlength=k)
+            sums = np.column_stack([np.bincount(labels, weights=xy[:, d], minlength=k) for d in range(2)])
+            occupied = counts > 0
+            centroids[occupied] = sums[occupied] / counts[occupied, None]
+
+        clusters = CentroidClusterIndex(centroids, km_scale)
+        for job, label in zip(jobs, labels.tolist()):
+            clusters.add(job, label)
+        return clusters
+
+    @staticmethod
+    def cleaner_capacity_hours(cleaners: List[Cleaner]) -> float:
+        """Average hours of work one cleaner can take on in a day"""
+        if not cleaners:
+            return 8.0
+        capacities = []
+        for cleaner in cleaners:
+            start, end = cleaner.working_hours.start_time, cleaner.working_hours.end_time
+            shift = (end.hour - start.hour) + (end.minute - start.minute) / 60
+            capacities.append(max(0.0, min(shift, cleaner.max_daily_hours)))
+        return max(sum(capacities) / len(capacities), 0.5)
+
+    @staticmethod
+    def _kmeans_plus_plus(xy: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+        centroids = np.empty((k, 2))
+        centroids[0] = xy[rng.integers(len(xy))]
+        nearest = ((xy - centroids[0]) ** 2).sum(axis=1)
+        for c in range(1, k):
+            total = nearest.sum()
+            pick = rng.choice(len(xy), p=nearest / total) if total > 0 else rng.integers(len(xy))
+            centroids[c] = xy[pick]
+            nearest = np.minimum(nearest, ((xy - centroids[c]) ** 2).sum(axis=1))
+        return centroids
+
+    @staticmethod
+    def _assign_with_capacity(xy: np.ndarray, hours: np.ndarray, centroids: np.ndarray,
+                              cluster_cap: float) -> np.ndarray:
+        distances = ((xy ** 2).sum(axis=1)[:, None] - 2 * xy @ centroids.T
+                     + (centroids ** 2).sum(axis=1)[None, :])
+        if centroids.shape[0] > 1:
+            two_nearest = np.argpartition(distances, 1, axis=1)[:, :2]
+            ranked = np.take_along_axis(distances, two_nearest, axis=1)
+            order = np.argsort(ranked[:, 0] - ranked[:, 1], kind="stable")
+            first_choice = two_nearest[:, 0].tolist()
+        else:
+            order = np.arange(len(xy))
+            first_choice = [0] * len(xy)
+
+        load = [0.0] * centroids.shape[0]
+        hours = hours.tolist()
+        labels = np.empty(len(xy), dtype=np.int64)
+        for i in order.tolist():
+            label = first_choice[i]
+            if load[label] + hours[i] > cluster_cap:
+                # A job too big for any remaining room stays with its nearest cluster
+                label = next((c for c in np.argsort(distances[i]).tolist() if load[c] + hours[i] <= cluster_cap), label)
+            labels[i] = label
+            load[label] += hours[i]
+        return labels
+
+    @staticmethod
+    def _jobs_fingerprint(jobs: List[Job]) -> str:
+        digest = hashlib.sha1()
+        for job in jobs:
+            digest.update(f"{job.id}|{job.coordinates[0]!r}|{job.coordinates[1]!r}|"
+                          f"{job.estimated_duration_hours!r};".encode())
+        return digest.hexdigest()
@@ -1,91 +1,200 @@
-from typing import List, Optional, Tuple, Dict
+import numpy as np
+from typing import Callable, List, Optional, Tuple
 from datetime import time
-from src.models.cleaner import Cleaner
-from src.models.job import Job
 from src.services.distance_service import DistanceService
+from src.services.travel_time_matrix import TravelTimeMatrix
 from .constraint_checker import ConstraintChecker
+from .job_clustering import JobClusterIndex
+from .job_spatial_index import JobSpatialIndex
+from .route_evaluator import CompiledProblem
 
 class JobFinder:
+    """Nearest-job searches over a CompiledProblem.
+
+    Candidates are arrays of job indices; ties in travel time go to the earlier
+    candidate. A spatial index, when given, covers every job of the problem, with the
+    job index as its pool position.
+    """
+
+    MIN_CANDIDATES_FOR_INDEX = 32
+    INDEX_BATCH_SIZE = 8
+
     def __init__(self, distance_service: DistanceService, constraint_checker: ConstraintChecker):
         self.distance_service = distance_service
         self.constraint_checker = constraint_checker
 
-    def find_closest_job_to_location(self, jobs: List[Job], location: Tuple[float, float]) -> Optional[Job]:
+    def travel_times_from(self, problem: CompiledProblem, location: Tuple[float, float], candidates: np.ndarray,
+                          travel_matrix: Optional[TravelTimeMatrix] = None,
+                          departure: Optional[time] = None) -> np.ndarray:
+        """Travel times (hours) from a location to each candidate, read from the matrix when available"""
+        if travel_matrix is not None:
+            return travel_matrix.row(travel_matrix.index_of(location), departure)[problem.point[candidates]]
+        get_matrix = getattr(self.distance_service, "get_matrix", None)
+        if get_matrix is not None:
+            # Remote providers answer a whole candidate list in one batched request
+            return get_matrix([location], [problem.jobs[k].coordinates for k in candidates.tolist()])[1][0]
+        return np.asarray([self.distance_service.calculate_travel_time_hours(location, problem.jobs[k].coordinates)
+                           for k in candidates.tolist()], dtype=float)
+
+    def find_closest_job_to_location(self, problem: CompiledProblem, candidates: np.ndarray,
+                                     location: Tuple[float, float],
+                                     travel_matrix: Optional[TravelTimeMatrix] = None,
+                                     departure: Optional[time] = None,
+                                     spatial_index: Optional[JobSpatialIndex] = None) -> Optional[int]:
         """Find the closest job to a given location"""
-        if not jobs:
+        if not len(candidates):
             return None
 
-        closest_job = None
-        min_distance = float('inf')
+        if spatial_index is not None and self.can_use_index(travel_matrix, len(candidates)):
+            return self._find_nearest_indexed(problem, candidates, location, spatial_index)
 
-        for job in jobs:
-            distance = self.distance_service.calculate_travel_time_hours(location, job.coordinates)
-            if distance < min_distance:
-                min_distance = distance
-                closest_job = job
+        travel_times = self.travel_times_from(problem, location, candidates, travel_matrix, departure)
+        if travel_matrix is not None and travel_matrix.is_estimated:
+            travel_times = self._refine_nearest(problem, location, candidates, travel_times, travel_matrix, departure)
 
-        return closest_job
+        return self._first_minimum(candidates, travel_times)
 
-    def find_closest_assignable_job(self, available_jobs: List[Job], current_location: Tuple[float, float],
-                                    cleaner: Cleaner, current_time: time, total_work_hours: float,
-                                    total_travel_hours: float) -> Optional[Job]:
-        """Find the closest job that can still be assigned given constraints"""
-        if not available_jobs or not current_location:
+    def find_closest_assignable_job(self, problem: CompiledProblem, candidates: np.ndarray,
+                                    current_location: Tuple[float, float], r: int, current_time: float,
+                                    departure: Optional[time], total_work_hours: float, total_travel_hours: float,
+                                    travel_matrix: Optional[TravelTimeMatrix] = None,
+                                    spatial_index: Optional[JobSpatialIndex] = None) -> Optional[int]:
+        """Find the closest job cleaner r can still take, leaving at ``current_time`` (hours of day)"""
+        if not len(candidates) or not current_location:
             return None
 
         # Filter jobs that match cleaner's skills
-        matching_jobs = [j for j in available_jobs
-                         if self.constraint_checker.has_required_skills(cleaner.skills, j.required_skills)]
-
-        closest_job = None
-        min_travel_time = float('inf')
-
-        for job in matching_jobs:
-            travel_time = self.distance_service.calculate_travel_time_hours(current_location, job.coordinates)
-            arrival_time = self.constraint_checker._add_hours_to_time(current_time, travel_time)
-            end_time = self.constraint_checker._add_hours_to_time(arrival_time, job.estimated_duration_hours)
-
-            # Check if this job can be assigned
-            if self.constraint_checker.can_assign_job(cleaner, job, arrival_time, end_time,
-                                                      total_work_hours + job.estimated_duration_hours,
-                                                      total_travel_hours + travel_time):
-                if travel_time < min_travel_time:
-                    min_travel_time = travel_time
-                    closest_job = job
-
-        return closest_job
-
-    def find_best_next_job(self, available_jobs: List[Job], current_location: Tuple[float, float],
-                           cleaner: Cleaner, current_time: time, total_work_hours: float,
-                           total_travel_hours: float, job_clusters: Dict) -> Optional[Job]:
-        """Find best next job considering clusters and constraints"""
-        if not available_jobs or not current_location:
-            return None
+        candidates = candidates[problem.eligible[candidates, r]]
+
+        def is_assignable(k, travel_time):
+            # Takes one job and its travel time, or arrays of both
+            return self.constraint_checker.assignable(problem, r, k, current_time + travel_time, travel_time,
+                                                      total_work_hours, total_travel_hours)
+
+        if spatial_index is not None and self.can_use_index(travel_matrix, len(candidates)):
+            return self._find_nearest_indexed(problem, candidates, current_location, spatial_index, is_assignable)
 
-        # First, try to find jobs in the same cluster
-        current_cluster = self._find_job_cluster(current_location, job_clusters)
-        cluster_jobs = []
+        travel_times = self.travel_times_from(problem, current_location, candidates, travel_matrix, departure)
+        if travel_matrix is not None and travel_matrix.is_estimated:
+            travel_times = self._refine_nearest(problem, current_location, candidates, travel_times,
+                                                travel_matrix, departure, is_assignable)
 
-        if current_cluster:
-            for job in available_jobs:
-                if self._find_job_cluster(job.coordinates, job_clusters) == current_cluster:
-                    cluster_jobs.append(job)
+        assignable = is_assignable(candidates, travel_times)
+        return self._first_minimum(candidates, np.where(assignable, travel_times, np.inf))
+
+    def can_use_index(self, travel_matrix: Optional[TravelTimeMatrix], candidate_count: int) -> bool:
+        """Whether a nearest-job search over this many candidates walks the spatial index"""
+        # Small candidate lists are cheaper to scan, and so is a matrix row, which is compared
+        # in one vectorized step; estimated matrices go through _refine_nearest
+        return travel_matrix is None and candidate_count >= self.MIN_CANDIDATES_FOR_INDEX
+
+    @staticmethod
+    def _first_minimum(candidates: np.ndarray, travel_times: np.ndarray) -> Optional[int]:
+        if not len(candidates):
+            return None
+        best = int(np.argmin(travel_times))
+        return int(candidates[best]) if travel_times[best] < float('inf') else None
+
+    def _find_nearest_indexed(self, problem: CompiledProblem, candidates: np.ndarray, location: Tuple[float, float],
+                              spatial_index: JobSpatialIndex,
+                              is_feasible: Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]] = None
+                              ) -> Optional[int]:
+        """Nearest feasible job among ``candidates`` by the distance service, visiting the index nearest-first.
+
+        Jobs are timed INDEX_BATCH_SIZE at a time, so a remote provider gets one request
+        per batch. Straight-line distance at MAX_SPEED_KMH bounds the travel time from
+        below, so the walk stops as soon as no remaining job can beat the best one found.
+        Ties go to the lower job index, as in the linear scan.
+        """
+        allowed = np.zeros(len(problem.jobs), dtype=bool)
+        allowed[candidates] = True
+        max_speed = self.distance_service.MAX_SPEED_KMH
+
+        best_job = None
+        best = (float('inf'), float('inf'))
+        batch = []
+
+        def consider(nearest: List[int]) -> None:
+            nonlocal best, best_job
+            jobs = np.asarray(nearest, dtype=np.int64)
+            travel_times = self.travel_times_from(problem, location, jobs)
+            if is_feasible is not None:
+                travel_times = np.where(is_feasible(jobs, travel_times), travel_times, np.inf)
+            first = int(np.lexsort((jobs, travel_times))[0])
+            if travel_times[first] < float('inf') and (travel_times[first], jobs[first]) < best:
+                best = (float(travel_times[first]), int(jobs[first]))
+                best_job = best[1]
+
+        for distance_km, k in spatial_index.nearest(location):
+            if distance_km / max_speed > best[0]:
+                break
+            if not allowed[k]:
+                continue
+            batch.append(k)
+            if len(batch) == self.INDEX_BATCH_SIZE:
+                consider(batch)
+                batch = []
+        if batch:
+            consider(batch)
+
+        return best_job
+
+    def _refine_nearest(self, problem: CompiledProblem, location: Tuple[float, float], candidates: np.ndarray,
+                        estimates: np.ndarray, travel_matrix: TravelTimeMatrix, departure: Optional[time],
+                        is_feasible: Optional[Callable[[int, float], bool]] = None) -> np.ndarray:
+        """Replace estimates with exact times, nearest estimate first, in small batches.
+
+        Estimates only set the order: they can be above the road time. The search stops
+        once the lower bound of every remaining candidate is above the best feasible
+        exact time, and those candidates get at least their bound, so none of them can
+        win.
+        """
+        travel_times = np.array(estimates, dtype=float)
+        origin = travel_matrix.index_of(location)
+        points = problem.point[candidates]
+        bounds = travel_matrix.lower_bounds(origin, points, departure)
+        order = np.argsort(estimates, kind="stable")
+        # Lowest bound among the candidates from each position of the order on
+        remaining_bound = np.minimum.accumulate(bounds[order][::-1])[::-1]
+        batch_size = max(1, getattr(travel_matrix, "refine_batch_size", 1))
+        best = float('inf')
+
+        refined = 0
+        while refined < len(order) and remaining_bound[refined] <= best:
+            batch = order[refined:refined + batch_size]
+            exact = travel_matrix.refine(origin, points[batch], departure)
+            for i, travel_time in zip(batch.tolist(), exact.tolist()):
+                travel_times[i] = travel_time
+                if travel_time < best and (is_feasible is None or is_feasible(int(candidates[i]), travel_time)):
+                    best = travel_time
+            refined += len(batch)
+
+        rest = order[refined:]
+        travel_times[rest] = np.maximum(travel_times[rest], bounds[rest])
+        return travel_times
+
+    def find_best_next_job(self, problem: CompiledProblem, available: np.ndarray,
+                           current_location: Tuple[float, float], r: int, current_time: float,
+                           departure: Optional[time], total_work_hours: float, total_travel_hours: float,
+                           job_clusters: JobClusterIndex, travel_matrix: Optional[TravelTimeMatrix] = None,
+                           spatial_index: Optional[JobSpatialIndex] = None) -> Optional[int]:
+        """Find best next job considering clusters and constraints; ``available`` masks the open jobs"""
+        if not current_location:
+            return None
+
+        # First, try the unassigned jobs in the same cluster
+        cluster_jobs = np.asarray([problem.position[job_id]
+                                   for job_id in job_clusters.live_ids(job_clusters.cell_of(current_location))],
+                                  dtype=np.int64)
+        cluster_jobs = cluster_jobs[available[cluster_jobs]]
 
         # Search in cluster first, then all jobs
-        for job_list in [cluster_jobs, available_jobs]:
+        for candidates in [cluster_jobs, np.flatnonzero(available)]:
             best_job = self.find_closest_assignable_job(
-                job_list, current_location, cleaner, current_time,
-                total_work_hours, total_travel_hours
+                problem, candidates, current_location, r, current_time, departure,
+                total_work_hours, total_travel_hours, travel_matrix, spatial_index
             )
-            if best_job:
+            if best_job is not None:
                 return best_job
 
         return None
-
-    def _find_job_cluster(self, location: Tuple[float, float], job_clusters: Dict) -> Optional[Tuple[int, int]]:
-        """Find which cluster a location belongs to"""
-        for cluster_key, jobs in job_clusters.items():
-            for job in jobs:
-                if job.coordinates == location:
-                    return cluster_key
-        return None
\ No newline at end of file
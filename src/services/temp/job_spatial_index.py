@@ -0,0 +1,103 @@
+import heapq
+import numpy as np
+from typing import Iterator, List, Optional, Tuple
+
+
+class JobSpatialIndex:
+    """KD-tree over a pool of job coordinates with deletion and nearest-first iteration.
+
+    Jobs are identified by their position in the pool. Coordinates are projected to a
+    flat km grid that underestimates true distances, so the distances yielded by
+    ``nearest`` are lower bounds on the geodesic distance. Removed jobs are tombstoned
+    and whole subtrees are skipped once they are empty.
+    """
+
+    LEAF_SIZE = 8
+    KM_PER_DEGREE = 111.19
+    SAFETY_FACTOR = 0.99
+
+    def __init__(self, coordinates: np.ndarray):
+        coords = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        n = len(coords)
+        self._alive = np.ones(n, dtype=bool)
+
+        # The smallest cos(lat) in (and a degree around) the pool keeps east-west distances a lower bound
+        self._cos_lat = float(np.cos(np.radians(min(89.9, np.abs(coords[:, 0]).max() + 1.0)))) if n else 1.0
+        self._xy = self._project(coords)
+
+        self._lo: List[np.ndarray] = []
+        self._hi: List[np.ndarray] = []
+        self._children: List[Optional[Tuple[int, int]]] = []
+        self._members: List[np.ndarray] = []
+        self._parent: List[int] = []
+        self._alive_count: List[int] = []
+        self._leaf_of = np.zeros(n, dtype=np.int64)
+        if n:
+            self._build(np.arange(n), -1)
+
+    def __len__(self) -> int:
+        return int(self._alive.sum())
+
+    def remove(self, k: int) -> None:
+        if not self._alive[k]:
+            return
+        self._alive[k] = False
+        node = int(self._leaf_of[k])
+        while node != -1:
+            self._alive_count[node] -= 1
+            node = self._parent[node]
+
+    def nearest(self, location: Tuple[float, float]) -> Iterator[Tuple[float, int]]:
+        """Yield (lower-bound km, pool position) for live jobs in increasing distance"""
+        if not len(self._alive):
+            return
+        query = self._project(np.asarray([location], dtype=float))[0]
+        heap = [(0.0, 0, 0)]  # (distance, kind 0=node/1=job, id)
+        while heap:
+            distance, kind, item = heapq.heappop(heap)
+            if kind == 1:
+                yield distance, item
+                continue
+            if self._alive_count[item] == 0:
+                continue
+            children = self._children[item]
+            if children is None:
+                members = self._members[item]
+                members = members[self._alive[members]]
+                dists = np.hypot(*(self._xy[members] - query).T)
+                for k, d in zip(members.tolist(), dists.tolist()):
+                    heapq.heappush(heap, (d, 1, k))
+            else:
+                for child in children:
+                    if self._alive_count[child]:
+                        heapq.heappush(heap, (self._box_distance(child, query), 0, child))
+
+    def _project(self, coords: np.ndarray) -> np.ndarray:
+        scale = self.KM_PER_DEGREE * self.SAFETY_FACTOR
+        return np.column_stack((coords[:, 0] * scale, coords[:, 1] * scale * self._cos_lat))
+
+    def _box_distance(self, node: int, query: np.ndarray) -> float:
+        gap = np.maximum(0.0, np.maximum(self._lo[node] - query, query - self._hi[node]))
+        return float(np.hypot(gap[0], gap[1]))
+
+    def _build(self, members: np.ndarray, parent: int) -> int:
+        node = len(self._lo)
+        points = self._xy[members]
+        self._lo.append(points.min(axis=0))
+        self._hi.append(points.max(axis=0))
+        self._parent.append(parent)
+        self._alive_count.append(len(members))
+        self._members.append(members)
+        self._children.append(None)
+
+        if len(members) <= self.LEAF_SIZE:
+            self._leaf_of[members] = node
+            return node
+
+        axis = int(np.argmax(self._hi[node] - self._lo[node]))
+        order = members[np.argsort(points[:, axis], kind="stable")]
+        half = len(order) // 2
+        left = self._build(order[:half], node)
+        right = self._build(order[half:], node)
+        self._children[node] = (left, right)
+        return node
@@ -1,10 +1,17 @@
 from datetime import time
+from .route_evaluator import hours_of_day
 from ...config import config
 
 class LunchScheduler:
     def __init__(self, config: config):
         self.config = config
+        self.window_start = hours_of_day(config.LUNCH_WINDOW_START)
+        self.window_end = hours_of_day(config.LUNCH_WINDOW_END)
 
     def should_schedule_lunch(self, current_time: time) -> bool:
         """Check if it's appropriate time for lunch"""
-        return (self.config.LUNCH_WINDOW_START <= current_time <= self.config.LUNCH_WINDOW_END)
\ No newline at end of file
+        return (self.config.LUNCH_WINDOW_START <= current_time <= self.config.LUNCH_WINDOW_END)
+
+    def should_schedule_lunch_at(self, hours: float) -> bool:
+        """should_schedule_lunch for a time given as hours of day"""
+        return self.window_start <= hours <= self.window_end
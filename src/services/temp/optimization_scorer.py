@@ -3,17 +3,20 @@ from src.models.schedule import DailySchedule
 from src.models.job import Priority
 
 class OptimizationScorer:
+    UNASSIGNED_PENALTY = 3  # Higher penalty for unassigned jobs
+    BALANCE_WEIGHT = 0.1
+
     def calculate_optimization_score(self, schedules: List[DailySchedule],
                                      unassigned_jobs: List[str]) -> float:
         """Calculate optimization score (lower is better)"""
         total_travel = sum(s.total_travel_hours for s in schedules)
-        penalty_unassigned = len(unassigned_jobs) * 3  # Higher penalty for unassigned jobs
+        penalty_unassigned = len(unassigned_jobs) * self.UNASSIGNED_PENALTY
 
         # Add penalty for unbalanced schedules
         if schedules:
             work_hours = [s.total_work_hours for s in schedules]
             avg_work = sum(work_hours) / len(work_hours)
-            variance_penalty = sum((h - avg_work) ** 2 for h in work_hours) * 0.1
+            variance_penalty = sum((h - avg_work) ** 2 for h in work_hours) * self.BALANCE_WEIGHT
         else:
             variance_penalty = 0
 
@@ -0,0 +1,155 @@
+import threading
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from multiprocessing import get_context, shared_memory
+from time import perf_counter, time
+from typing import List, Optional, Tuple
+from src.models.cleaner import Cleaner
+from src.models.job import Job
+from src.models.schedule import ScheduleOptimizationResult
+from src.services.distance_service import DistanceService
+from src.services.travel_time_matrix import TravelTimeMatrix
+
+
+class ParallelMultiStartSolver:
+    """Runs independent solver variants on several cores and keeps the best result.
+
+    The calling process runs variant 0, the default pipeline, so the parallel result is
+    never worse than the serial one. Worker processes run variants 1..workers-1, which
+    differ in tie-breaking of the job order, regret k and ALNS seed. All of them get
+    the same deadline. The travel-time matrix is copied once into shared memory,
+    and the workers map it read-only instead of receiving a pickled copy each.
+    A byte after the matrix is the workers' stop flag: once ``stop`` is set the solver
+    raises it and no longer waits, and the workers end their solve after the current
+    stage or ALNS iteration. The worker processes are spawned by ``start``; a solve
+    that has to spawn them first does not count that time against its deadline.
+    """
+
+    # How often a stopped solve is noticed while waiting for the workers
+    STOP_POLL_SECONDS = 0.1
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._started = False
+
+    @staticmethod
+    def can_share(travel_matrix: Optional[TravelTimeMatrix]) -> bool:
+        """Only fully materialized static matrices can be shared; profiles and hybrid
+        matrices fetch road times lazily through the parent's distance provider"""
+        return (travel_matrix is not None and not travel_matrix.is_time_dependent
+                and not travel_matrix.is_estimated)
+
+    def solve(self, service, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+              travel_matrix: TravelTimeMatrix, deadline: Optional[float],
+              max_iterations: Optional[int], stop: Optional[threading.Event] = None) -> ScheduleOptimizationResult:
+        if not self._started:
+            # Spawning the workers is not part of the solve's budget
+            spawn_started = perf_counter()
+            self.start()
+            if deadline is not None:
+                deadline += perf_counter() - spawn_started
+
+        hours = np.ascontiguousarray(travel_matrix.hours, dtype=np.float64)
+        segment = shared_memory.SharedMemory(create=True, size=hours.nbytes + 1)
+        stop_flag = np.ndarray((1,), dtype=np.uint8, buffer=segment.buf, offset=hours.nbytes)
+        stop_flag[0] = 0
+        try:
+            np.ndarray(hours.shape, dtype=np.float64, buffer=segment.buf)[:] = hours
+            # perf_counter values are per process, so workers get the deadline as wall-clock time
+            wall_deadline = None if deadline is None else time() + deadline - perf_counter()
+            futures = [self._pool().submit(_solve_variant, segment.name, hours.shape, travel_matrix.points,
+                                           service.config, cleaners, jobs, target_date, wall_deadline,
+                                           max_iterations, variant)
+                       for variant in range(1, self.workers)]
+
+            results = [service.solve_variant(cleaners, jobs, target_date, travel_matrix, deadline, max_iterations,
+                                             stop=stop)]
+            pending = set(futures)
+            while pending and not (stop is not None and stop.is_set()):
+                _, pending = wait(pending, self.STOP_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in futures:
+                if future in pending:
+                    future.cancel()
+                    continue
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"Multi-start worker failed: {e}")
+        finally:
+            # Workers still running end at their next check; their mapping outlives the unlink
+            stop_flag[0] = 1
+            del stop_flag
+            segment.close()
+            segment.unlink()
+
+        # min() keeps the earliest variant on ties, so equal scores return the serial result
+        return min(results, key=lambda result: result.optimization_score)
+
+    def start(self) -> None:
+        """Spawn the worker processes and load the solver in them, ahead of the first solve"""
+        if self.workers < 2 or self._started:
+            return
+        pool = self._pool()
+        # Submitted together, each warm-up lands on a newly spawned process
+        for future in [pool.submit(_warm_up) for _ in range(self.workers - 1)]:
+            future.result()
+        self._started = True
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+            self._started = False
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: the API process runs an event loop and HTTP client threads that fork would copy
+            self._executor = ProcessPoolExecutor(max_workers=self.workers - 1, mp_context=get_context("spawn"))
+        return self._executor
+
+
+class _SharedStop:
+    """Worker-side stand-in for the solve's threading.Event: a flag byte the parent sets"""
+
+    __slots__ = ("flag",)
+
+    def __init__(self, flag: np.ndarray):
+        self.flag = flag
+
+    def is_set(self) -> bool:
+        return bool(self.flag[0])
+
+
+def _warm_up() -> None:
+    """Worker entry point that only imports the solver"""
+    from . import assignment_service
+
+
+def _solve_variant(segment_name: str, shape: Tuple[int, int], points, config, cleaners: List[Cleaner],
+                   jobs: List[Job], target_date: datetime, wall_deadline: Optional[float],
+                   max_iterations: Optional[int], variant: int) -> ScheduleOptimizationResult:
+    """Worker entry point: solve one variant on the shared matrix"""
+    deadline = None if wall_deadline is None else perf_counter() + wall_deadline - time()
+    segment = shared_memory.SharedMemory(name=segment_name)
+    try:
+        return _solve_on_segment(segment, shape, points, config, cleaners, jobs, target_date,
+                                 deadline, max_iterations, variant)
+    finally:
+        # Every view of the buffer died with _solve_on_segment's frame
+        segment.close()
+
+
+def _solve_on_segment(segment: shared_memory.SharedMemory, shape: Tuple[int, int], points, config,
+                      cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+                      deadline: Optional[float], max_iterations: Optional[int],
+                      variant: int) -> ScheduleOptimizationResult:
+    from .assignment_service import OptimizedAssignmentService
+
+    hours = np.ndarray(shape, dtype=np.float64, buffer=segment.buf)
+    hours.flags.writeable = False
+    stop = _SharedStop(np.ndarray((1,), dtype=np.uint8, buffer=segment.buf, offset=hours.nbytes))
+    service = OptimizedAssignmentService(DistanceService(), config)
+    return service.solve_variant(cleaners, jobs, target_date, TravelTimeMatrix(points, hours),
+                                 deadline, max_iterations, variant, stop)
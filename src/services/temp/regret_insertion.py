@@ -0,0 +1,219 @@
+import numpy as np
+from datetime import datetime
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+from src.models.cleaner import Cleaner
+from src.models.job import Job
+from src.models.schedule import DailySchedule
+from .constraint_checker import ConstraintChecker
+from .route_evaluator import RouteEvaluator, RouteSlack, RouteTiming
+
+
+class RegretInsertionBuilder:
+    """Builds every cleaner's route at once by regret-k insertion.
+
+    For each unassigned job the cheapest insertion (added travel, including the leg
+    from home to the first job) is kept per cleaner. The job whose best option is
+    hardest to replace - the summed gap to its next k-1 best cleaners - is inserted
+    first, less COST_WEIGHT times what the insertion costs (added travel plus the job's
+    own hours), so cheap short jobs win ties on overloaded days where every cleaner
+    runs out of time. After an insertion only that cleaner's column of insertion costs
+    is recomputed.
+
+    Costs and time windows are screened with NumPy against the current route timings,
+    ignoring how the insertion shifts lunch; the chosen insertion is then timed exactly
+    with RouteEvaluator before it is applied. Positions the route's lunch-aware
+    RouteSlack rules out are never timed.
+    """
+
+    # Regret charged for each of the k best cleaners a job cannot be inserted into
+    MISSING_OPTION_HOURS = 24.0
+    COST_WEIGHT = 0.5
+
+    def __init__(self, config, constraint_checker: Optional[ConstraintChecker] = None):
+        self.config = config
+        self.constraint_checker = constraint_checker or ConstraintChecker()
+
+    def build(self, cleaners: List[Cleaner], jobs: List[Job], target_date: datetime,
+              evaluator: RouteEvaluator, regret_k: Optional[int] = None,
+              deadline: Optional[float] = None) -> Tuple[List[DailySchedule], List[Job]]:
+        """Schedules for all cleaners and the jobs left unassigned (in input order).
+
+        Insertion stops at ``deadline`` (a time.perf_counter() value); the jobs not
+        inserted by then are left unassigned.
+        """
+        state = InsertionState(cleaners, jobs, evaluator, evaluator.compile(cleaners, jobs).eligible)
+        self.insert(state, max(2, regret_k or self.config.REGRET_K), deadline)
+
+        schedules = [evaluator.to_schedule(cleaner, [jobs[j] for j in route], timing, target_date)
+                     for cleaner, route, timing in zip(cleaners, state.routes, state.timings)]
+        assigned = {j for route in state.routes for j in route}
+        return schedules, [job for k, job in enumerate(jobs) if k not in assigned]
+
+    def insert(self, state: "InsertionState", regret_k: int, deadline: Optional[float] = None) -> None:
+        """Insert the state's open jobs until none fits or the deadline passes; regret_k=1 is plain
+        cheapest insertion"""
+        priority = state.problem.priority
+        regret_k = min(regret_k, len(state.cleaners))
+
+        for r in range(len(state.cleaners)):
+            state.update_route_costs(r)
+
+        while deadline is None or perf_counter() < deadline:
+            open_jobs = np.flatnonzero(state.remaining)
+            if not len(open_jobs):
+                break
+            costs = state.cost[open_jobs]
+            best = costs.min(axis=1)
+            stuck = ~np.isfinite(best)
+            if stuck.any():
+                # Routes only grow, so a job with no feasible insertion never gets one
+                state.remaining[open_jobs[stuck]] = False
+                open_jobs, costs, best = open_jobs[~stuck], costs[~stuck], best[~stuck]
+                if not len(open_jobs):
+                    break
+
+            urgency = self._regret(costs, best, regret_k) - self.COST_WEIGHT * (best + state.duration[open_jobs])
+            pick = np.lexsort((best, priority[open_jobs], -urgency))[0]
+            job = int(open_jobs[pick])
+            route = int(np.argmin(costs[pick]))
+            state.insert_best(job, route)
+
+    def _regret(self, costs: np.ndarray, best: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, costs.shape[1])
+        nearest = np.sort(np.partition(costs, k - 1, axis=1)[:, :k], axis=1)
+        nearest = np.where(np.isfinite(nearest), nearest, best[:, None] + self.MISSING_OPTION_HOURS)
+        return (nearest[:, 1:] - nearest[:, :1]).sum(axis=1)
+
+
+class InsertionState:
+    """Routes under construction with the best insertion cost/position of every open job.
+
+    Starts from empty routes with every job open, or from given routes (job indices
+    into ``jobs``) and their timings with only ``open_jobs`` left to insert.
+    """
+
+    def __init__(self, cleaners: List[Cleaner], jobs: List[Job], evaluator: RouteEvaluator,
+                 eligible: np.ndarray, routes: Optional[List[List[int]]] = None,
+                 timings: Optional[List[RouteTiming]] = None, open_jobs: Optional[np.ndarray] = None):
+        self.cleaners = cleaners
+        self.jobs = jobs
+        self.evaluator = evaluator
+        self.matrix = evaluator.travel_matrix
+        self.eligible = eligible
+
+        n, m = len(jobs), len(cleaners)
+        self.problem = evaluator.compile(cleaners, jobs)
+        self.point = self.problem.point
+        self.home = self.problem.home
+        self.duration = self.problem.duration
+        self.latest = self.problem.latest
+
+        if routes is None:
+            self.routes: List[List[int]] = [[] for _ in cleaners]
+            self.timings: List[RouteTiming] = [RouteTiming([], [], [], 0.0, 0.0) for _ in cleaners]
+            self.remaining = np.ones(n, dtype=bool)
+        else:
+            self.routes = routes
+            self.timings = timings
+            self.remaining = np.zeros(n, dtype=bool)
+            self.remaining[open_jobs] = True
+        self.cost = np.full((n, m), np.inf)
+        self.position = np.zeros((n, m), dtype=np.int64)
+        self._slack: Dict[int, Optional[RouteSlack]] = {}
+
+    def update_route_costs(self, r: int) -> None:
+        """Screen every open job's insertion into route r at every position"""
+        self.cost[:, r] = np.inf
+        candidates = np.flatnonzero(self.remaining & self.eligible[:, r])
+        if not len(candidates):
+            return
+
+        timing = self.timings[r]
+        route_points = self.point[self.routes[r]]
+        hours = self.matrix.hours
+        points = self.point[candidates]
+        start = self.problem.start[r]
+        day_end = self.problem.day_end[r]
+        day_slack = self.problem.max_hours[r] - timing.total_work_hours - timing.total_travel_hours
+        size = len(route_points)
+
+        # Row p is an insertion before the p-th job of the route (p == size appends)
+        prev_end = np.concatenate(([start], timing.ends))[:, None]
+        inbound = np.zeros((size + 1, len(points)))
+        outbound = np.zeros((size + 1, len(points)))
+        removed = np.zeros((size + 1, 1))
+        next_arrival = np.full((size + 1, 1), np.inf)
+        forward_slack = np.full((size + 1, 1), np.inf)
+        if size:
+            inbound[1:] = hours[route_points][:, points]
+            outbound[:-1] = hours[points][:, route_points].T
+            removed[1:-1, 0] = hours[route_points[:-1], route_points[1:]]
+            arrivals = np.asarray(timing.arrivals)
+            next_arrival[:-1, 0] = arrivals
+            window_slack = np.minimum(self.latest[self.routes[r]] - arrivals, day_end - timing.ends[-1])
+            forward_slack[:-1, 0] = np.minimum.accumulate(window_slack[::-1])[::-1]
+
+        arrival = prev_end + inbound
+        end = arrival + self.duration[candidates]
+        added_travel = inbound + outbound - removed
+        push = np.where(np.isfinite(next_arrival), end + outbound - next_arrival, 0.0)
+        feasible = ((arrival <= self.latest[candidates]) & (end <= day_end) & (push <= forward_slack)
+                    & (self.duration[candidates] + added_travel <= day_slack))
+
+        cost = added_travel.copy()
+        cost[0] += hours[self.home[r], points] - (hours[self.home[r], route_points[0]] if size else 0.0)
+        cost = np.where(feasible, cost, np.inf)
+        best = np.argmin(cost, axis=0)
+        self.cost[candidates, r] = cost[best, np.arange(len(candidates))]
+        self.position[candidates, r] = best
+
+    def insert_best(self, j: int, r: int) -> None:
+        """Insert job j into route r at its screened position, re-planning r exactly if that fails"""
+        route = self.routes[r]
+        p = int(self.position[j, r])
+        candidate = route[:p] + [j] + route[p:]
+        timing = self._simulate(r, candidate) if self._may_insert(j, r, p) else None
+        if timing is None:
+            # The screen was optimistic (usually a shifted lunch); take the best exact position
+            self.cost[j, r], self.position[j, r] = self._exact_best(j, r)
+            return
+
+        self.routes[r] = candidate
+        self.timings[r] = timing
+        self._slack.pop(r, None)
+        self.remaining[j] = False
+        self.update_route_costs(r)
+
+    def _exact_best(self, j: int, r: int) -> Tuple[float, int]:
+        route = self.routes[r]
+        hours = self.matrix.hours
+        home = self.home[r]
+        base = self.timings[r].total_travel_hours + (hours[home, self.point[route[0]]] if route else 0.0)
+        # Every position's legs to and from job j, one batch each way for estimated matrices
+        route_points = self.point[route]
+        self.evaluator.refine_legs(route_points, np.full(len(route), self.point[j]))
+        self.evaluator.refine_legs(np.full(len(route), self.point[j]), route_points)
+        best = (np.inf, 0)
+        for p in range(len(route) + 1):
+            if not self._may_insert(j, r, p):
+                continue
+            candidate = route[:p] + [j] + route[p:]
+            timing = self._simulate(r, candidate)
+            if timing is not None:
+                cost = timing.total_travel_hours + hours[home, self.point[candidate[0]]] - base
+                best = min(best, (float(cost), p))
+        return best
+
+    def _may_insert(self, j: int, r: int, p: int) -> bool:
+        # Positions the slack screen rules out are never timed
+        if r not in self._slack:
+            route = self.routes[r]
+            self._slack[r] = self.evaluator.slack(self.point[route].tolist(), self.latest[route].tolist(),
+                                                  float(self.problem.start[r]), float(self.problem.day_end[r]),
+                                                  float(self.problem.max_hours[r]), self.timings[r])
+        slack = self._slack[r]
+        return slack is None or slack.may_insert(int(self.point[j]), float(self.duration[j]), float(self.latest[j]), p)
+
+    def _simulate(self, r: int, route: List[int]) -> Optional[RouteTiming]:
+        return self.evaluator.simulate(self.cleaners[r], [self.jobs[j] for j in route])
@@ -0,0 +1,297 @@
+import numpy as np
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+from src.models.cleaner import Cleaner, Skill
+from src.models.job import Job
+from src.models.schedule import Assignment, DailySchedule
+from src.services.travel_time_matrix import TravelTimeMatrix
+from .optimization_scorer import OptimizationScorer
+
+
+def hours_of_day(t: time) -> float:
+    """Time of day as fractional hours since midnight"""
+    return t.hour + t.minute / 60 + t.second / 3600 + t.microsecond / 3_600_000_000
+
+
+def time_of_hours(hours: float) -> time:
+    """Fractional hours since midnight as a time of day"""
+    return (datetime.combine(datetime.today(), time(0, 0)) + timedelta(hours=hours)).time()
+
+
+SKILL_BITS: Dict[Skill, int] = {skill: 1 << bit for bit, skill in enumerate(Skill)}
+
+
+def skill_mask(skills: Iterable[Skill]) -> int:
+    """Skills as a bitmask, one bit per Skill"""
+    mask = 0
+    for skill in skills:
+        mask |= SKILL_BITS[skill]
+    return mask
+
+
+class RouteTiming:
+    """Timing of a feasible route: per-job arrival, end and inbound travel, all in hours"""
+
+    __slots__ = ("arrivals", "ends", "travel", "total_work_hours", "total_travel_hours")
+
+    def __init__(self, arrivals: List[float], ends: List[float], travel: List[float],
+                 total_work_hours: float, total_travel_hours: float):
+        self.arrivals = arrivals
+        self.ends = ends
+        self.travel = travel
+        self.total_work_hours = total_work_hours
+        self.total_travel_hours = total_travel_hours
+
+
+class RouteSlack:
+    """Constant-time insertion screen for a route timed by RouteEvaluator.
+
+    Per position p it keeps the departure for the p-th job (the start of the day, then
+    each job's end), its earliest start (the arrival; nobody waits) and its latest
+    start: how late it may start without breaking its own or any later job's window or
+    the end of the day. That forward slack is lunch-aware: a job inserted before the
+    leg that took lunch may take lunch itself, freeing one break for the jobs after
+    that leg. ``may_insert`` replays the lunch rule for the inserted job and the next
+    leg, so it only rejects insertions that certainly fail; accepted ones still have to
+    be timed by RouteEvaluator. Only valid on matrices with fixed travel times.
+    """
+
+    EPSILON = 1e-9
+
+    __slots__ = ("evaluator", "points", "departure", "earliest", "latest", "forward_slack", "lunch_leg",
+                 "day_end", "hours_left")
+
+    def __init__(self, evaluator: "RouteEvaluator", points: List[int], latest_starts: List[float],
+                 start: float, day_end: float, max_hours: float, timing: RouteTiming):
+        n = len(points)
+        arrivals, ends = timing.arrivals, timing.ends
+        self.evaluator = evaluator
+        self.points = points
+        self.departure = [start] + ends
+        self.earliest = arrivals
+        self.day_end = day_end
+        self.hours_left = max_hours - timing.total_work_hours - timing.total_travel_hours
+
+        # The leg that took lunch: its arrival is a break later than the previous end plus travel
+        self.lunch_leg = next((k for k in range(1, n)
+                               if arrivals[k] - ends[k - 1] - timing.travel[k] > evaluator.lunch_hours / 2), n)
+
+        window_slack = [latest - arrival for latest, arrival in zip(latest_starts, arrivals)]
+        if n:
+            window_slack[-1] = min(window_slack[-1], day_end - ends[-1])
+        suffix = [float('inf')] * (n + 1)
+        for k in range(n - 1, -1, -1):
+            suffix[k] = min(window_slack[k], suffix[k + 1])
+        # Before the lunch leg a push is bounded by the jobs up to it, and by those after
+        # it once the break that is no longer taken there is given back
+        m = self.lunch_leg
+        self.forward_slack = list(suffix[:n])
+        after_lunch = suffix[m] + evaluator.lunch_hours
+        to_lunch = float('inf')
+        for k in range(m - 1, -1, -1):
+            to_lunch = min(window_slack[k], to_lunch)
+            self.forward_slack[k] = min(to_lunch, after_lunch)
+        self.latest = [arrival + slack for arrival, slack in zip(arrivals, self.forward_slack)]
+
+    def may_insert(self, point: int, duration: float, latest_start: float, p: int) -> bool:
+        """False when inserting a job before the p-th job (p == len appends) certainly makes the route infeasible"""
+        evaluator = self.evaluator
+        hours = evaluator.travel_matrix.hours
+        lunch_start, lunch_end, lunch_hours = evaluator.lunch_start, evaluator.lunch_end, evaluator.lunch_hours
+        eps = self.EPSILON
+
+        lunch_taken = self.lunch_leg < p
+        arrival = current = self.departure[p]
+        inbound = 0.0
+        if p:
+            if not lunch_taken and lunch_start <= current <= lunch_end:
+                current += lunch_hours
+                lunch_taken = True
+            inbound = hours[self.points[p - 1], point]
+            arrival = current + inbound
+            if not lunch_taken and lunch_start <= arrival <= lunch_end:
+                arrival += lunch_hours
+                lunch_taken = True
+        end = arrival + duration
+        if arrival > latest_start + eps or end > self.day_end + eps:
+            return False
+
+        added_travel = inbound
+        if p < len(self.points):
+            current = end
+            if not lunch_taken and lunch_start <= current <= lunch_end:
+                current += lunch_hours
+                lunch_taken = True
+            outbound = hours[point, self.points[p]]
+            arrival = current + outbound
+            if not lunch_taken and lunch_start <= arrival <= lunch_end:
+                arrival += lunch_hours
+            if arrival > self.latest[p] + eps:
+                return False
+            added_travel += outbound - (hours[self.points[p - 1], self.points[p]] if p else 0.0)
+        return duration + added_travel <= self.hours_left + eps
+
+
+class CompiledProblem:
+    """Column arrays of a day's cleaners and jobs, read by the solver's inner loops.
+
+    Job k and cleaner r are positions in ``jobs`` and ``cleaners``. Times are hours of
+    day (``latest`` is inf for jobs without a latest start), ``point``/``home`` are
+    travel-matrix indices and skills are skill_mask bitmasks; ``eligible`` is the
+    jobs x cleaners matrix of who has the skills for what, computed from them once.
+    The pydantic models are read once here; loops work on job indices and only
+    finished routes are turned back into models.
+    """
+
+    __slots__ = ("cleaners", "jobs", "position", "point", "coordinates", "duration", "latest", "priority",
+                 "required_skills", "home", "start", "day_end", "max_hours", "skills", "eligible")
+
+    def __init__(self, cleaners: List[Cleaner], jobs: List[Job], travel_matrix: TravelTimeMatrix):
+        self.cleaners = cleaners
+        self.jobs = jobs
+        self.position: Dict[str, int] = {job.id: k for k, job in enumerate(jobs)}
+        self.point = np.asarray([travel_matrix.index_of(j.coordinates) for j in jobs], dtype=np.int64)
+        self.coordinates = np.asarray([j.coordinates for j in jobs], dtype=float).reshape(-1, 2)
+        self.duration = np.asarray([j.estimated_duration_hours for j in jobs], dtype=float)
+        self.latest = np.asarray([hours_of_day(j.latest_start_time) if j.latest_start_time else np.inf
+                                  for j in jobs], dtype=float)
+        weight = OptimizationScorer().priority_weight
+        self.priority = np.asarray([weight(j.priority) for j in jobs], dtype=np.int64)
+        self.required_skills = np.asarray([skill_mask(j.required_skills) for j in jobs], dtype=np.int64)
+
+        self.home = np.asarray([travel_matrix.index_of(c.home_coordinates) for c in cleaners], dtype=np.int64)
+        self.start = np.asarray([hours_of_day(c.working_hours.start_time) for c in cleaners], dtype=float)
+        self.day_end = np.asarray([hours_of_day(c.working_hours.end_time) for c in cleaners], dtype=float)
+        self.max_hours = np.asarray([c.max_daily_hours for c in cleaners], dtype=float)
+        self.skills = np.asarray([skill_mask(c.skills) for c in cleaners], dtype=np.int64)
+        self.eligible = self.skill_eligibility(self.skills, self.required_skills)
+
+    @staticmethod
+    def skill_eligibility(cleaner_skills: np.ndarray, required_skills: np.ndarray) -> np.ndarray:
+        """jobs x cleaners matrix from skill masks: a cleaner qualifies when no required bit is missing"""
+        return (required_skills[:, None] & ~cleaner_skills[None, :]) == 0
+
+
+class RouteEvaluator:
+    """Times a job sequence for a cleaner the way ScheduleBuilder does.
+
+    The first job starts at the start of the working day with no travel. Lunch is taken
+    once, before travelling when the cleaner is free inside the lunch window, or on
+    arrival when the arrival falls inside it. A route is feasible when every job ends
+    by the end of the working day, starts by its latest start time, and work plus
+    travel stay within max_daily_hours. Travel times come from the matrix; on estimated
+    (hybrid) matrices a route's legs are refined to exact values in one batch first.
+    """
+
+    def __init__(self, config, travel_matrix: TravelTimeMatrix):
+        self.config = config
+        self.travel_matrix = travel_matrix
+        self.lunch_start = hours_of_day(config.LUNCH_WINDOW_START)
+        self.lunch_end = hours_of_day(config.LUNCH_WINDOW_END)
+        self.lunch_hours = config.LUNCH_DURATION_HOURS
+        self._point_of: Dict[str, int] = {}
+        self._compiled: Optional[CompiledProblem] = None
+
+    def point_of(self, job: Job) -> int:
+        """Matrix index of a job's location"""
+        index = self._point_of.get(job.id)
+        if index is None:
+            index = self._point_of[job.id] = self.travel_matrix.index_of(job.coordinates)
+        return index
+
+    def compile(self, cleaners: List[Cleaner], jobs: List[Job]) -> CompiledProblem:
+        """Column arrays for these cleaner and job lists, reused while the same (unmodified) lists are passed"""
+        compiled = self._compiled
+        if compiled is None or compiled.cleaners is not cleaners or compiled.jobs is not jobs:
+            compiled = self._compiled = CompiledProblem(cleaners, jobs, self.travel_matrix)
+        return compiled
+
+    def slack(self, points: List[int], latest_starts: List[float], start: float, day_end: float,
+              max_hours: float, timing: RouteTiming) -> Optional[RouteSlack]:
+        """Insertion screen for a timed route, or None when travel times depend on when or whether they were asked for"""
+        if self.travel_matrix.is_estimated or self.travel_matrix.is_time_dependent:
+            return None
+        return RouteSlack(self, points, latest_starts, start, day_end, max_hours, timing)
+
+    def refine_legs(self, origins: Sequence[int], destinations: Sequence[int]) -> None:
+        """Have an estimated matrix fetch exact times for these legs in one batch (nothing to do otherwise)"""
+        if self.travel_matrix.is_estimated and len(origins):
+            self.travel_matrix.refine_pairs(origins, destinations)
+
+    def leg_hours(self, origin: int, destination: int, departure: float) -> float:
+        """Travel time between two matrix points, leaving at ``departure`` (hours of day)"""
+        matrix = self.travel_matrix
+        if matrix.is_estimated:
+            return float(matrix.refine(origin, [destination])[0])
+        if matrix.is_time_dependent:
+            return matrix.travel_time_hours(origin, destination, time_of_hours(departure))
+        return float(matrix.hours[origin, destination])
+
+    def simulate(self, cleaner: Cleaner, jobs: List[Job]) -> Optional[RouteTiming]:
+        """Timing of ``jobs`` visited in order, or None when the route is infeasible"""
+        start = hours_of_day(cleaner.working_hours.start_time)
+        day_end = hours_of_day(cleaner.working_hours.end_time)
+        max_hours = cleaner.max_daily_hours
+        points = [self.point_of(job) for job in jobs]
+        self.refine_legs(points[:-1], points[1:])
+
+        arrivals, ends, travel = [], [], []
+        current = start
+        lunch_taken = False
+        total_work = total_travel = 0.0
+        previous = None
+        for job, point in zip(jobs, points):
+            if previous is None:
+                travel_time = 0.0
+                arrival = current
+            else:
+                if not lunch_taken and self.lunch_start <= current <= self.lunch_end:
+                    current += self.lunch_hours
+                    lunch_taken = True
+                travel_time = self.leg_hours(previous, point, current)
+                arrival = current + travel_time
+                if not lunch_taken and self.lunch_start <= arrival <= self.lunch_end:
+                    current += self.lunch_hours
+                    arrival += self.lunch_hours
+                    lunch_taken = True
+
+            end = arrival + job.estimated_duration_hours
+            total_work += job.estimated_duration_hours
+            total_travel += travel_time
+            if end > day_end or total_work + total_travel > max_hours:
+                return None
+            if job.latest_start_time and arrival > hours_of_day(job.latest_start_time):
+                return None
+
+            arrivals.append(arrival)
+            ends.append(end)
+            travel.append(travel_time)
+            current = end
+            previous = point
+
+        return RouteTiming(arrivals, ends, travel, total_work, total_travel)
+
+    def to_schedule(self, cleaner: Cleaner, jobs: List[Job], timing: RouteTiming,
+                    target_date: datetime) -> DailySchedule:
+        """DailySchedule for a timed route"""
+        assignments = []
+        for order, (job, arrival, end, travel_time) in enumerate(
+                zip(jobs, timing.arrivals, timing.ends, timing.travel)):
+            assignments.append(Assignment(
+                job_id=job.id,
+                cleaner_id=cleaner.id,
+                scheduled_start_time=time_of_hours(arrival),
+                scheduled_end_time=time_of_hours(end),
+                travel_time_to_job=travel_time,
+                travel_time_from_job=timing.travel[order + 1] if order + 1 < len(jobs) else 0.0,
+                sequence_order=order
+            ))
+
+        return DailySchedule(
+            cleaner_id=cleaner.id,
+            date=target_date,
+            assignments=assignments,
+            total_work_hours=timing.total_work_hours,
+            total_travel_hours=timing.total_travel_hours,
+            total_day_length=timing.total_work_hours + timing.total_travel_hours
+        )
@@ -1,69 +1,176 @@
+from collections import deque
 from datetime import datetime
-from typing import List
-from src.models.schedule import Assignment, DailySchedule
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+from src.models.cleaner import Cleaner
+from src.models.job import Job
+from src.models.schedule import DailySchedule
 from src.services.distance_service import DistanceService
+from .route_evaluator import RouteEvaluator, RouteTiming
 from ...config import config
 
+
+class LegTables:
+    """Travel between a route's jobs: legs[a][b], prefix sums of forward/backward legs, and job positions"""
+
+    __slots__ = ("legs", "forward", "backward", "position")
+
+    def __init__(self, legs: List[List[float]], forward: List[float], backward: List[float],
+                 position: Dict[str, int]):
+        self.legs = legs
+        self.forward = forward
+        self.backward = backward
+        self.position = position
+
+
 class RouteOptimizer:
+    """Intra-route local search: 2-opt, Or-opt and swap moves within each cleaner's day.
+
+    Moves are screened with constant-time travel deltas from the matrix (prefix sums of
+    forward and backward legs keep 2-opt exact on asymmetric matrices). A move that
+    looks improving is timed with RouteEvaluator and applied only when the route stays
+    feasible and its travel really drops. Don't-look bits keep the search on jobs whose
+    neighbourhood changed instead of restarting after every accepted move; the leg
+    tables behind the deltas are built once per route and again only after a move.
+    """
+
+    MAX_SEGMENT_LENGTH = 3
+    EPSILON = 1e-9
+
     def __init__(self, distance_service: DistanceService, config: config = None):
         self.distance_service = distance_service
         self.config = config or config()
 
-    def improve_schedules_2opt(self, schedules: List[DailySchedule],
-                               target_date: datetime) -> List[DailySchedule]:
-        """Simple 2-opt improvement to reduce travel time"""
+    def improve_schedules_2opt(self, schedules: List[DailySchedule], target_date: datetime,
+                               cleaners: List[Cleaner], jobs: List[Job],
+                               evaluator: RouteEvaluator, deadline: Optional[float] = None) -> List[DailySchedule]:
+        """Reorder each schedule's jobs to reduce travel time.
+
+        Routes not started by ``deadline`` (a time.perf_counter() value) are kept as they are.
+        """
+        cleaners_by_id = {c.id: c for c in cleaners}
+        jobs_by_id = {j.id: j for j in jobs}
         improved_schedules = []
 
         for schedule in schedules:
-            if len(schedule.assignments) < self.config.MIN_JOBS_FOR_2OPT:
+            expired = deadline is not None and perf_counter() >= deadline
+            if expired or len(schedule.assignments) < self.config.MIN_JOBS_FOR_2OPT:
+                improved_schedules.append(schedule)
+                continue
+
+            cleaner = cleaners_by_id[schedule.cleaner_id]
+            route = [jobs_by_id[a.job_id] for a in schedule.assignments]
+            timing = evaluator.simulate(cleaner, route)
+            if timing is None:
                 improved_schedules.append(schedule)
                 continue
 
-            # Try swapping pairs of jobs to reduce travel time
-            best_assignments = schedule.assignments.copy()
-            best_travel_time = schedule.total_travel_hours
-
-            improved = True
-            while improved:
-                improved = False
-                for i in range(1, len(best_assignments) - 2):  # Skip first job
-                    for j in range(i + 1, len(best_assignments)):
-                        # Create new sequence with swapped jobs
-                        new_assignments = best_assignments.copy()
-                        new_assignments[i], new_assignments[j] = new_assignments[j], new_assignments[i]
-
-                        # Recalculate travel times
-                        new_travel_time = self.calculate_total_travel_time(new_assignments)
-
-                        if new_travel_time < best_travel_time:
-                            best_assignments = new_assignments
-                            best_travel_time = new_travel_time
-                            improved = True
-                            break
-                    if improved:
-                        break
-
-            # Rebuild schedule with optimized sequence
-            optimized_schedule = self.rebuild_schedule_with_new_sequence(
-                schedule, best_assignments, target_date
-            )
-            improved_schedules.append(optimized_schedule)
+            new_route, new_timing = self.improve_route(cleaner, route, timing, evaluator)
+            if new_timing is timing:
+                improved_schedules.append(schedule)
+            else:
+                improved_schedules.append(evaluator.to_schedule(cleaner, new_route, new_timing, target_date))
 
         return improved_schedules
 
-    def calculate_total_travel_time(self, assignments: List[Assignment]) -> float:
-        """Calculate total travel time for a sequence of assignments"""
-        return sum(a.travel_time_to_job for a in assignments)
-
-    def rebuild_schedule_with_new_sequence(self, original_schedule: DailySchedule,
-                                           new_assignments: List[Assignment],
-                                           target_date: datetime) -> DailySchedule:
-        """Rebuild schedule with new job sequence"""
-        return DailySchedule(
-            cleaner_id=original_schedule.cleaner_id,
-            date=target_date,
-            assignments=new_assignments,
-            total_work_hours=original_schedule.total_work_hours,
-            total_travel_hours=original_schedule.total_travel_hours,
-            total_day_length=original_schedule.total_day_length
-        )
\ No newline at end of file
+    def improve_route(self, cleaner: Cleaner, route: List[Job], timing: RouteTiming,
+                      evaluator: RouteEvaluator) -> Tuple[List[Job], RouteTiming]:
+        """Local optimum of a feasible route and its timing"""
+        # On an estimated matrix moves are screened on estimates; simulate() refines the
+        # legs of the moves that pass, so only legs a candidate route would drive are fetched
+        route = list(route)
+        queue = deque(job.id for job in route)
+        queued = set(queue)
+        tables = self._leg_tables(route, evaluator)
+
+        while queue:
+            job_id = queue.popleft()
+            queued.discard(job_id)
+
+            move = self._improving_move(cleaner, route, timing, tables, job_id, evaluator)
+            if move is None:
+                continue  # Don't look at this job again until a neighbour changes
+
+            route, timing, touched = move
+            tables = self._leg_tables(route, evaluator)
+            for k in touched:
+                for neighbour in (k - 1, k, k + 1):
+                    if 0 <= neighbour < len(route) and route[neighbour].id not in queued:
+                        queue.append(route[neighbour].id)
+                        queued.add(route[neighbour].id)
+
+        return route, timing
+
+    @staticmethod
+    def _leg_tables(route: List[Job], evaluator: RouteEvaluator) -> LegTables:
+        """Leg matrix, prefix sums and positions of a route, rebuilt only when a move is accepted"""
+        points = [evaluator.point_of(job) for job in route]
+        legs = evaluator.travel_matrix.hours[points][:, points].tolist()
+        forward = [0.0] * len(route)
+        backward = [0.0] * len(route)
+        for k in range(1, len(route)):
+            forward[k] = forward[k - 1] + legs[k - 1][k]
+            backward[k] = backward[k - 1] + legs[k][k - 1]
+        return LegTables(legs, forward, backward, {job.id: k for k, job in enumerate(route)})
+
+    def _improving_move(self, cleaner: Cleaner, route: List[Job], timing: RouteTiming, tables: LegTables,
+                        job_id: str,
+                        evaluator: RouteEvaluator) -> Optional[Tuple[List[Job], RouteTiming, Tuple[int, ...]]]:
+        """First feasible improving 2-opt, Or-opt or swap move anchored at the job's position"""
+        n = len(route)
+        i = tables.position[job_id]
+        legs, forward, backward = tables.legs, tables.forward, tables.backward
+
+        def leg(a: int, b: int) -> float:
+            # Travel before the first job and after the last one is not counted
+            return legs[a][b] if 0 <= a < n and 0 <= b < n else 0.0
+
+        def attempt(delta: float, build: Callable[[], List[Job]], touched: Tuple[int, ...]):
+            if delta >= -self.EPSILON:
+                return None
+            candidate = build()
+            new_timing = evaluator.simulate(cleaner, candidate)
+            if new_timing is None or new_timing.total_travel_hours >= timing.total_travel_hours - self.EPSILON:
+                return None
+            return candidate, new_timing, touched
+
+        # 2-opt: reverse route[a..b] for every segment with i as an end
+        for a, b in [(i, b) for b in range(i + 1, n)] + [(a, i) for a in range(i)]:
+            delta = (leg(a - 1, b) + leg(a, b + 1) - leg(a - 1, a) - leg(b, b + 1)
+                     + (backward[b] - backward[a]) - (forward[b] - forward[a]))
+            move = attempt(delta, lambda: route[:a] + route[a:b + 1][::-1] + route[b + 1:], (a, b))
+            if move:
+                return move
+
+        # Or-opt: move route[i..i+length-1] between positions k and k+1
+        for length in range(1, min(self.MAX_SEGMENT_LENGTH, n - i) + 1):
+            last = i + length - 1
+            removal = leg(i - 1, last + 1) - leg(i - 1, i) - leg(last, last + 1)
+            segment = route[i:last + 1]
+            rest = route[:i] + route[last + 1:]
+            for k in range(-1, n):
+                if i - 1 <= k <= last:
+                    continue
+                delta = removal + leg(k, i) + leg(last, k + 1) - leg(k, k + 1)
+                at = k + 1 if k < i else k + 1 - length
+                move = attempt(delta, lambda: rest[:at] + segment + rest[at:], (at, at + length - 1))
+                if move:
+                    return move
+
+        # Swap route[i] with route[j]
+        for j in range(n):
+            if j == i:
+                continue
+            a, b = min(i, j), max(i, j)
+            if b == a + 1:
+                delta = (leg(a - 1, b) + leg(b, a) + leg(a, b + 1)
+                         - leg(a - 1, a) - leg(a, b) - leg(b, b + 1))
+            else:
+                delta = (leg(a - 1, b) + leg(b, a + 1) + leg(b - 1, a) + leg(a, b + 1)
+                         - leg(a - 1, a) - leg(a, a + 1) - leg(b - 1, b) - leg(b, b + 1))
+            move = attempt(delta, lambda: route[:a] + [route[b]] + route[a + 1:b] + [route[a]] + route[b + 1:],
+                           (a, b))
+            if move:
+                return move
+
+        return None
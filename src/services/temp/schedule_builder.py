@@ -1,12 +1,14 @@
-from datetime import datetime, time
-from typing import List, Dict
-from src.models.cleaner import Cleaner
-from src.models.job import Job
-from src.models.schedule import Assignment, DailySchedule
+import numpy as np
+from datetime import time
+from typing import List, Optional, Tuple
 from src.services.distance_service import DistanceService
+from src.services.travel_time_matrix import TravelTimeMatrix
 from .constraint_checker import ConstraintChecker
+from .job_clustering import JobClusterIndex
 from .job_finder import JobFinder
+from .job_spatial_index import JobSpatialIndex
 from .lunch_scheduler import LunchScheduler
+from .route_evaluator import CompiledProblem, RouteTiming, time_of_hours
 from ...config import config
 
 class ScheduleBuilder:
@@ -17,114 +19,99 @@ class ScheduleBuilder:
         self.job_finder = JobFinder(distance_service, self.constraint_checker)
         self.lunch_scheduler = LunchScheduler(self.config)
 
-    def create_optimized_schedule(self, cleaner: Cleaner, available_jobs: List[Job],
-                                  target_date: datetime, job_clusters: Dict) -> DailySchedule:
-        """Create schedule with lunch break and clustered job assignment"""
-        assignments = []
-        current_time = cleaner.working_hours.start_time
+    def build_route(self, problem: CompiledProblem, r: int, remaining: np.ndarray, job_clusters: JobClusterIndex,
+                    travel_matrix: Optional[TravelTimeMatrix] = None,
+                    spatial_index: Optional[JobSpatialIndex] = None) -> Tuple[List[int], RouteTiming]:
+        """Create cleaner r's route with lunch break and clustered job assignment.
+
+        Picks from the jobs flagged in ``remaining`` and returns the job indices in
+        visiting order with their timing. Taken jobs are cleared from ``remaining``,
+        ``job_clusters`` and ``spatial_index``.
+        """
+        route: List[int] = []
+        arrivals: List[float] = []
+        ends: List[float] = []
+        travel: List[float] = []
+        current_time = float(problem.start[r])
+        day_end = float(problem.day_end[r])
         current_location = None
         total_work_hours = 0.0
         total_travel_hours = 0.0
-        sequence_order = 0
         lunch_scheduled = False
 
         # Filter jobs by skills
-        matching_jobs = [j for j in available_jobs
-                         if self.constraint_checker.has_required_skills(cleaner.skills, j.required_skills)]
-
-        if not matching_jobs:
-            return DailySchedule(
-                cleaner_id=cleaner.id,
-                date=target_date,
-                assignments=[],
-                total_work_hours=0,
-                total_travel_hours=0,
-                total_day_length=0
-            )
+        matching = remaining & problem.eligible[:, r]
+
+        def take(k: int, arrival: float, travel_time: float) -> float:
+            end = arrival + float(problem.duration[k])
+            route.append(k)
+            arrivals.append(arrival)
+            ends.append(end)
+            travel.append(travel_time)
+            remaining[k] = matching[k] = False
+            if spatial_index is not None:
+                spatial_index.remove(k)
+            job_clusters.remove(problem.jobs[k])
+            return end
 
         # Start with job closest to home
-        first_job = self.job_finder.find_closest_job_to_location(matching_jobs, cleaner.home_coordinates)
-        if first_job and self.constraint_checker.can_assign_first_job(cleaner, first_job, current_time):
-            end_time = self.constraint_checker._add_hours_to_time(current_time, first_job.estimated_duration_hours)
-
-            assignments.append(Assignment(
-                job_id=first_job.id,
-                cleaner_id=cleaner.id,
-                scheduled_start_time=current_time,
-                scheduled_end_time=end_time,
-                travel_time_to_job=0.0,
-                travel_time_from_job=0.0,
-                sequence_order=sequence_order
-            ))
-
-            current_time = end_time
-            current_location = first_job.coordinates
-            total_work_hours += first_job.estimated_duration_hours
-            sequence_order += 1
-            matching_jobs.remove(first_job)
+        first_job = self.job_finder.find_closest_job_to_location(
+            problem, np.flatnonzero(matching), problem.cleaners[r].home_coordinates, travel_matrix,
+            self._departure(current_time, travel_matrix), spatial_index
+        )
+        if first_job is not None and self.constraint_checker.assignable(problem, r, first_job, current_time,
+                                                                        0.0, 0.0, 0.0):
+            current_time = take(first_job, current_time, 0.0)
+            current_location = problem.jobs[first_job].coordinates
+            total_work_hours += float(problem.duration[first_job])
 
         # Continue assigning jobs with lunch break consideration
-        while matching_jobs and current_time < cleaner.working_hours.end_time:
+        while current_location is not None and current_time < day_end and matching.any():
             # Check if it's time for lunch
-            if not lunch_scheduled and self.lunch_scheduler.should_schedule_lunch(current_time):
-                current_time = self.constraint_checker._add_hours_to_time(current_time, self.config.LUNCH_DURATION_HOURS)
+            if not lunch_scheduled and self.lunch_scheduler.should_schedule_lunch_at(current_time):
+                current_time += self.config.LUNCH_DURATION_HOURS
                 lunch_scheduled = True
                 continue
 
             # Find next best job (considering clusters)
+            departure = self._departure(current_time, travel_matrix)
             next_job = self.job_finder.find_best_next_job(
-                matching_jobs, current_location, cleaner, current_time,
-                total_work_hours, total_travel_hours, job_clusters
+                problem, matching, current_location, r, current_time, departure,
+                total_work_hours, total_travel_hours, job_clusters, travel_matrix, spatial_index
             )
 
-            if not next_job:
+            if next_job is None:
                 break
 
             # Calculate travel time
-            travel_time = self.distance_service.calculate_travel_time_hours(
-                current_location, next_job.coordinates
-            ) if current_location else 0.0
-
-            arrival_time = self.constraint_checker._add_hours_to_time(current_time, travel_time)
+            location = problem.jobs[next_job].coordinates
+            travel_time = self._travel_time(current_location, location, travel_matrix, departure)
+            arrival_time = current_time + travel_time
 
             # Check if we need lunch before this job
-            if not lunch_scheduled and self.lunch_scheduler.should_schedule_lunch(arrival_time):
-                current_time = self.constraint_checker._add_hours_to_time(current_time, self.config.LUNCH_DURATION_HOURS)
+            if not lunch_scheduled and self.lunch_scheduler.should_schedule_lunch_at(arrival_time):
+                current_time += self.config.LUNCH_DURATION_HOURS
                 lunch_scheduled = True
-                arrival_time = self.constraint_checker._add_hours_to_time(arrival_time, self.config.LUNCH_DURATION_HOURS)
-
-            end_time = self.constraint_checker._add_hours_to_time(arrival_time, next_job.estimated_duration_hours)
-
-            # Create assignment
-            assignment = Assignment(
-                job_id=next_job.id,
-                cleaner_id=cleaner.id,
-                scheduled_start_time=arrival_time,
-                scheduled_end_time=end_time,
-                travel_time_to_job=travel_time,
-                travel_time_from_job=0.0,
-                sequence_order=sequence_order
-            )
-
-            assignments.append(assignment)
-
-            # Update previous assignment's travel_time_from_job
-            if len(assignments) > 1:
-                assignments[-2].travel_time_from_job = travel_time
+                arrival_time += self.config.LUNCH_DURATION_HOURS
 
             # Update state
-            current_time = end_time
-            current_location = next_job.coordinates
-            total_work_hours += next_job.estimated_duration_hours
+            current_time = take(next_job, arrival_time, travel_time)
+            current_location = location
+            total_work_hours += float(problem.duration[next_job])
             total_travel_hours += travel_time
-            sequence_order += 1
-            matching_jobs.remove(next_job)
 
-        return DailySchedule(
-            cleaner_id=cleaner.id,
-            date=target_date,
-            assignments=assignments,
-            total_work_hours=total_work_hours,
-            total_travel_hours=total_travel_hours,
-            total_day_length=total_work_hours + total_travel_hours
-        )
\ No newline at end of file
+        return route, RouteTiming(arrivals, ends, travel, total_work_hours, total_travel_hours)
+
+    @staticmethod
+    def _departure(hours: float, travel_matrix: Optional[TravelTimeMatrix]) -> Optional[time]:
+        # Only time-dependent matrices look at the departure time
+        if travel_matrix is not None and travel_matrix.is_time_dependent:
+            return time_of_hours(hours)
+        return None
+
+    def _travel_time(self, origin, destination, travel_matrix: Optional[TravelTimeMatrix],
+                     departure: Optional[time] = None) -> float:
+        """Leg cost, using the time-profile bucket of the planned departure when available"""
+        if travel_matrix is not None:
+            return travel_matrix.calculate_travel_time_hours(origin, destination, departure)
+        return self.distance_service.calculate_travel_time_hours(origin, destination)
@@ -0,0 +1,113 @@
+import numpy as np
+from datetime import datetime
+from typing import List, Set, Tuple
+from src.models.cleaner import Cleaner
+from src.models.job import Job
+from src.models.schedule import DailySchedule, ScheduleDelta, ScheduleOptimizationResult
+from .inter_route_optimizer import InterRouteOptimizer
+from .regret_insertion import InsertionState, RegretInsertionBuilder
+from .route_evaluator import RouteEvaluator, RouteTiming
+from .route_optimizer import RouteOptimizer
+
+
+class ScheduleRepairer:
+    """Patches an existing schedule after jobs or cleaners change instead of re-solving the day.
+
+    Removed and changed jobs are taken off their routes, changed cleaners lose the jobs
+    they no longer have the skills for, and removed cleaners free all of theirs. A route
+    that no longer times feasibly is cut back to its longest feasible prefix. Every job
+    left off a route (added, changed, freed or previously unassigned) is then regret-
+    inserted into the current routes; jobs that were unassigned before are only tried on
+    routes the delta changed. Inter-route moves start only from jobs on the routes this
+    touched, and only those routes get the intra-route local search; every other
+    schedule is returned unchanged.
+    """
+
+    def __init__(self, config, regret_builder: RegretInsertionBuilder,
+                 inter_route_optimizer: InterRouteOptimizer, route_optimizer: RouteOptimizer):
+        self.config = config
+        self.regret_builder = regret_builder
+        self.inter_route_optimizer = inter_route_optimizer
+        self.route_optimizer = route_optimizer
+
+    def repair(self, result: ScheduleOptimizationResult, delta: ScheduleDelta, cleaners: List[Cleaner],
+               jobs: List[Job], target_date: datetime,
+               evaluator: RouteEvaluator) -> Tuple[List[DailySchedule], List[Job]]:
+        """Repaired schedules (one per cleaner, in ``cleaners`` order) and the unassigned jobs.
+
+        ``cleaners`` and ``jobs`` already have the delta applied.
+        """
+        index_of = {job.id: k for k, job in enumerate(jobs)}
+        previous = {s.cleaner_id: s for s in result.schedules}
+        replaced = {j.id for j in delta.changed_jobs} | set(delta.removed_job_ids)
+        changed_cleaners = {c.id for c in delta.changed_cleaners}
+        eligible = evaluator.compile(cleaners, jobs).eligible.copy()
+
+        routes: List[List[int]] = []
+        timings: List[RouteTiming] = []
+        touched: Set[int] = set()
+        frozen: Set[int] = set()
+        for r, cleaner in enumerate(cleaners):
+            schedule = previous.get(cleaner.id)
+            old_ids = [a.job_id for a in schedule.assignments] if schedule else []
+            route = [index_of[i] for i in old_ids if i in index_of and i not in replaced]
+            if cleaner.id in changed_cleaners:
+                route = [j for j in route if eligible[j, r]]
+            timing = evaluator.simulate(cleaner, [jobs[j] for j in route])
+
+            if schedule is None or cleaner.id in changed_cleaners or len(route) != len(old_ids):
+                touched.add(r)
+                if timing is None:
+                    route, timing = self._feasible_prefix(cleaner, route, jobs, evaluator)
+            elif timing is None:
+                # An untouched route the evaluator cannot reproduce is kept exactly as it was
+                frozen.add(r)
+                eligible[:, r] = False
+                timing = RouteTiming([], [], [], 0.0, 0.0)
+            routes.append(route)
+            timings.append(timing)
+
+        # Jobs that did not fit before can only fit into a route the delta changed
+        untouched = [r for r in range(len(cleaners)) if r not in touched]
+        still_unassigned = [index_of[i] for i in result.unassigned_jobs if i in index_of and i not in replaced]
+        eligible[np.ix_(still_unassigned, untouched)] = False
+
+        on_route = {j for r, route in enumerate(routes) for j in route}
+        open_jobs = np.asarray([k for k in range(len(jobs)) if k not in on_route], dtype=np.int64)
+        state = InsertionState(cleaners, jobs, evaluator, eligible,
+                               [list(route) for route in routes], list(timings), open_jobs)
+        self.regret_builder.insert(state, max(2, self.config.REGRET_K))
+        touched.update(r for r, route in enumerate(state.routes) if route != routes[r])
+
+        schedules = []
+        for r, cleaner in enumerate(cleaners):
+            if r in touched:
+                route = [jobs[j] for j in state.routes[r]]
+                schedules.append(evaluator.to_schedule(cleaner, route, state.timings[r], target_date))
+            else:
+                schedules.append(previous[cleaner.id])
+        assigned = {j for r, route in enumerate(state.routes) if r not in frozen for j in route}
+        assigned.update(index_of[a.job_id] for r in frozen for a in schedules[r].assignments)
+        unassigned = [job for k, job in enumerate(jobs) if k not in assigned]
+
+        before = list(schedules)
+        schedules, unassigned = self.inter_route_optimizer.improve(schedules, unassigned, cleaners, jobs,
+                                                                   target_date, evaluator, focus=touched)
+        touched.update(r for r, schedule in enumerate(schedules) if schedule is not before[r])
+
+        order = sorted(touched)
+        improved = self.route_optimizer.improve_schedules_2opt([schedules[r] for r in order], target_date,
+                                                               cleaners, jobs, evaluator)
+        for r, schedule in zip(order, improved):
+            schedules[r] = schedule
+        return schedules, unassigned
+
+    @staticmethod
+    def _feasible_prefix(cleaner: Cleaner, route: List[int], jobs: List[Job],
+                         evaluator: RouteEvaluator) -> Tuple[List[int], RouteTiming]:
+        # Lunch and waiting only depend on earlier jobs, so every prefix of the kept order is a candidate
+        for end in range(len(route) - 1, -1, -1):
+            timing = evaluator.simulate(cleaner, [jobs[j] for j in route[:end]])
+            if timing is not None:
+                return route[:end], timing
+        return [], RouteTiming([], [], [], 0.0, 0.0)
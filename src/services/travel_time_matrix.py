@@ -0,0 +1,97 @@
+import numpy as np
+from datetime import datetime, time, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Bucket id used for travel times that are not tied to a departure time
+LIVE_BUCKET = -1
+
+
+def time_bucket(departure: datetime, bucket_minutes: int) -> int:
+    """Weekly time-of-day bucket of a departure (traffic profiles repeat per weekday)"""
+    minute_of_week = departure.weekday() * 1440 + departure.hour * 60 + departure.minute
+    return minute_of_week // bucket_minutes
+
+
+def bucket_start(target_date: datetime, departure: time, bucket_minutes: int) -> datetime:
+    """Start of the bucket containing a departure time on the target date"""
+    minutes = departure.hour * 60 + departure.minute
+    minutes -= minutes % bucket_minutes
+    return datetime.combine(target_date.date(), time(0, 0)) + timedelta(minutes=minutes)
+
+
+class TravelTimeMatrix:
+    """All-pairs travel times (hours) for a fixed set of points, addressed by integer index.
+
+    With a ``bucket_loader`` the matrix is a time-dependent profile: lookups that pass a
+    departure time read the matrix of that time-of-day bucket on ``target_date``, loading
+    it on first use. Lookups without a departure time read ``hours``.
+    """
+
+    # True when some entries are estimates that refine() can replace with exact values
+    is_estimated = False
+
+    def __init__(self, points: Sequence[Tuple[float, float]], hours: np.ndarray,
+                 bucket_loader: Optional[Callable[[datetime], np.ndarray]] = None,
+                 target_date: Optional[datetime] = None, bucket_minutes: int = 30):
+        self.points: List[Tuple[float, float]] = list(points)
+        self.hours = hours
+        self.bucket_loader = bucket_loader
+        self.target_date = target_date
+        self.bucket_minutes = bucket_minutes
+        self._profiles: Dict[int, np.ndarray] = {}
+        self._index: Dict[Tuple[float, float], int] = {}
+        for i, point in enumerate(self.points):
+            self._index.setdefault(tuple(point), i)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __contains__(self, point: Tuple[float, float]) -> bool:
+        return tuple(point) in self._index
+
+    @property
+    def is_time_dependent(self) -> bool:
+        return self.bucket_loader is not None
+
+    def index_of(self, point: Tuple[float, float]) -> int:
+        """Matrix index of a coordinate pair"""
+        return self._index[tuple(point)]
+
+    def hours_at(self, departure: Optional[time] = None) -> np.ndarray:
+        """Matrix for the bucket of a departure time (the static matrix when not time-dependent)"""
+        if departure is None or self.bucket_loader is None:
+            return self.hours
+        start = bucket_start(self.target_date, departure, self.bucket_minutes)
+        bucket = time_bucket(start, self.bucket_minutes)
+        if bucket not in self._profiles:
+            self._profiles[bucket] = self.bucket_loader(start)
+        return self._profiles[bucket]
+
+    def travel_time_hours(self, i: int, j: int, departure: Optional[time] = None) -> float:
+        return float(self.hours_at(departure)[i, j])
+
+    def row(self, i: int, departure: Optional[time] = None) -> np.ndarray:
+        """Travel times from point i to every other point"""
+        return self.hours_at(departure)[i]
+
+    def refine(self, i: int, js: Sequence[int], departure: Optional[time] = None) -> np.ndarray:
+        """Exact travel times from point i to points js (already exact in a plain matrix)"""
+        return self.hours_at(departure)[i, list(js)]
+
+    def refine_pairs(self, origins: Sequence[int], destinations: Sequence[int],
+                     departure: Optional[time] = None) -> np.ndarray:
+        """Exact travel times for the pairs (origins[k], destinations[k])"""
+        return self.hours_at(departure)[list(origins), list(destinations)]
+
+    def lower_bounds(self, i: int, js: Sequence[int], departure: Optional[time] = None) -> np.ndarray:
+        """Travel times from point i to points js can be no shorter than these (exact here)"""
+        return self.hours_at(departure)[i, list(js)]
+
+    def calculate_travel_time_hours(self, point1: Tuple[float, float], point2: Tuple[float, float],
+                                    departure: Optional[time] = None) -> float:
+        return float(self.hours_at(departure)[self.index_of(point1), self.index_of(point2)])
+
+    @staticmethod
+    def unique_points(points: Sequence[Tuple[float, float]]) -> List[Tuple[float, float]]:
+        """Deduplicate coordinates while keeping their first-seen order"""
+        return list(dict.fromkeys(tuple(p) for p in points))
@@ -0,0 +1,50 @@
+import random
+from datetime import datetime, time
+from time import perf_counter
+
+from src.config.config import Settings
+from src.models.cleaner import Cleaner, Skill, WorkingHours
+from src.models.job import Job, Priority
+from src.services.distance_service import DistanceService
+from src.services.temp.assignment_service import OptimizedAssignmentService
+
+TARGET_DATE = datetime(2026, 10, 19)
+
+
+def make_day(job_count: int, cleaner_count: int, seed: int = 1):
+    """A reproducible day of jobs and cleaners spread over Stockholm"""
+    rnd = random.Random(seed)
+    skills = list(Skill)
+
+    def coordinates():
+        return 59.2 + rnd.random() * 0.3, 17.8 + rnd.random() * 0.5
+
+    cleaners = [Cleaner(id=f"c{i}", name=f"Cleaner {i}", email=f"c{i}@example.com", phone="0",
+                        home_address="home", home_coordinates=coordinates(), skills=rnd.sample(skills, 4),
+                        working_hours=WorkingHours(start_time=time(rnd.choice([6, 7, 8])),
+                                                   end_time=time(rnd.choice([15, 16, 17]))),
+                        max_daily_hours=8.5)
+                for i in range(cleaner_count)]
+    jobs = [Job(id=f"j{i}", client_name="client", address="address", coordinates=coordinates(),
+                required_skills=rnd.sample(skills, rnd.choice([1, 1, 2])),
+                estimated_duration_hours=rnd.choice([0.5, 1, 1.5, 2, 3]),
+                latest_start_time=rnd.choice([None, None, time(12), time(14)]),
+                priority=rnd.choice(list(Priority)), created_at=datetime(2026, 1, 1))
+            for i in range(job_count)]
+    return cleaners, jobs
+
+
+def test_interactive_budget_bounds_wall_clock_on_a_large_day():
+    # Unbounded, construction and improvement of this day take about a second
+    cleaners, jobs = make_day(1000, 60)
+    service = OptimizedAssignmentService(DistanceService(), Settings(parallel_workers=1))
+    budget = 0.2
+
+    start = perf_counter()
+    result = service.create_schedule(cleaners, jobs, TARGET_DATE, time_budget_seconds=budget)
+    elapsed = perf_counter() - start
+
+    assert elapsed < 2 * budget
+    assigned = [a.job_id for s in result.schedules for a in s.assignments]
+    assert len(result.schedules) == len(cleaners)
+    assert sorted(assigned + result.unassigned_jobs) == sorted(j.id for j in jobs)